@@ -87,8 +87,8 @@ typedef struct _PyInterpreterFrame {
 } internal_frame_PyInterpreterFrame;
 
 // Use compile-time checks to select the correct structure based on Python
-// version
-#if PY_MAJOR_VERSION == 3 && PY_MINOR_VERSION == 11 && PY_MICRO_VERSION == 12
+// version. The 3.11 layout is identical across all 3.11.x micro releases.
+#if PY_MAJOR_VERSION == 3 && PY_MINOR_VERSION == 11
 #define internal_frame_PyInterpreterFrame                                      \
   internal_frame_PyInterpreterFrame_3_11_12
 #endif
@@ -101,34 +101,66 @@ private:
   PyFrameObject *bad_frame = nullptr;
   PyObject *trace_logic;
   PyObject *config;
+  // 预先取出trace_logic的绑定方法，避免每个事件都按名字查找方法并解析格式串
+  PyObject *handle_call_method = nullptr;
+  PyObject *handle_return_method = nullptr;
+  PyObject *handle_line_method = nullptr;
+  PyObject *handle_exception_method = nullptr;
+  PyObject *handle_opcode_method = nullptr;
+  // 排除函数名在构造时读入，调用事件中不再回调python层判断
+  std::unordered_set<std::string> exclude_functions;
   std::mutex cache_mutex;
 
   void print_stack_trace() { PyErr_PrintEx(1); }
 
+  void load_exclude_functions() {
+    PyObject *names = PyObject_GetAttrString(config, "exclude_functions");
+    if (names == NULL) {
+      PyErr_Clear();
+      return;
+    }
+    PyObject *iter = PyObject_GetIter(names);
+    Py_DECREF(names);
+    if (iter == NULL) {
+      PyErr_Clear();
+      return;
+    }
+    PyObject *item;
+    while ((item = PyIter_Next(iter)) != NULL) {
+      const char *name = PyUnicode_Check(item) ? PyUnicode_AsUTF8(item) : NULL;
+      if (name != NULL) {
+        exclude_functions.insert(name);
+      }
+      Py_DECREF(item);
+    }
+    Py_DECREF(iter);
+    PyErr_Clear();
+  }
+
+  void call_handler(PyObject *method, PyObject *arg1, PyObject *arg2 = NULL,
+                    PyObject *arg3 = NULL, PyObject *arg4 = NULL) {
+    PyObject *ret =
+        PyObject_CallFunctionObjArgs(method, arg1, arg2, arg3, arg4, NULL);
+    if (ret != NULL) {
+      Py_DECREF(ret);
+    } else {
+      print_stack_trace();
+    }
+  }
+
   bool is_excluded_function(PyFrameObject *frame) {
-    if (!frame || !config)
+    if (!frame || exclude_functions.empty())
       return false;
 
     PyCodeObject *code = PyFrame_GetCode(frame);
     if (!code)
       return false;
 
-    PyObject *func_name = code->co_name;
-    if (!func_name) {
-      Py_DECREF(code);
-      return false;
-    }
-
-    PyObject *result =
-        PyObject_CallMethod(config, "is_excluded_function", "O", func_name);
+    const char *func_name =
+        code->co_name ? PyUnicode_AsUTF8(code->co_name) : NULL;
+    bool excluded =
+        func_name != NULL && exclude_functions.count(func_name) > 0;
     Py_DECREF(code);
-
-    if (result == NULL) {
-      return false;
-    }
-
-    bool excluded = PyObject_IsTrue(result);
-    Py_DECREF(result);
     return excluded;
   }
 
@@ -199,18 +231,32 @@ public:
         trace_logic(tracer_logic) {
     Py_INCREF(trace_logic);
     Py_INCREF(config);
+    handle_call_method = PyObject_GetAttrString(trace_logic, "handle_call");
+    handle_return_method = PyObject_GetAttrString(trace_logic, "handle_return");
+    handle_line_method = PyObject_GetAttrString(trace_logic, "handle_line");
+    handle_exception_method =
+        PyObject_GetAttrString(trace_logic, "handle_exception");
+    handle_opcode_method = PyObject_GetAttrString(trace_logic, "handle_opcode");
+    load_exclude_functions();
+  }
+
+  bool is_valid() const {
+    return handle_call_method && handle_return_method && handle_line_method &&
+           handle_exception_method && handle_opcode_method;
   }
 
   ~TraceDispatcher() {
+    Py_XDECREF(handle_call_method);
+    Py_XDECREF(handle_return_method);
+    Py_XDECREF(handle_line_method);
+    Py_XDECREF(handle_exception_method);
+    Py_XDECREF(handle_opcode_method);
     Py_XDECREF(trace_logic);
     Py_XDECREF(config);
   }
 
   static int trace_dispatch_thunk(PyObject *self, PyFrameObject *frame,
-                                  int event, PyObject *arg) {
-    TraceDispatcher *dispatcher = reinterpret_cast<TraceDispatcher *>(self);
-    return dispatcher->trace_dispatch(frame, event, arg);
-  }
+                                  int event, PyObject *arg);
 
   int trace_dispatch(PyFrameObject *frame, int event, PyObject *arg) {
     if (bad_frame != nullptr && frame == bad_frame &&
@@ -240,6 +286,10 @@ public:
   }
 
   void add_target_frame(PyFrameObject *frame) {
+    // 与Python实现一致，只跟踪匹配目标文件的帧；is_target_frame内部会加锁
+    if (!is_target_frame(frame)) {
+      return;
+    }
     std::lock_guard<std::mutex> lock(cache_mutex);
     active_frames.insert(frame);
     struct internal_frame *frame_internal = (struct internal_frame *)frame;
@@ -289,17 +339,11 @@ public:
       Py_INCREF(var_name);
       Py_INCREF(stack_top_element);
       PyObject *opcode_object = PyLong_FromSize_t(last_opcode);
-      PyObject *ret = PyObject_CallMethod(trace_logic, "handle_opcode", "OOOO",
-                                          (PyObject *)frame, opcode_object,
-                                          var_name, stack_top_element);
+      call_handler(handle_opcode_method, (PyObject *)frame, opcode_object,
+                   var_name, stack_top_element);
       Py_DECREF(var_name);
       Py_DECREF(stack_top_element);
       Py_DECREF(opcode_object);
-      if (ret != NULL) {
-        Py_DECREF(ret);
-      } else {
-        print_stack_trace();
-      }
     } else if (last_opcode == CALL) {
       uint8_t arg_size = frame_interpreter->prev_instr->arg;
       PyObject **sp =
@@ -326,17 +370,11 @@ public:
       }
       PyTuple_SET_ITEM(args, total_args, is_method);
       PyObject *opcode_object = PyLong_FromSize_t(last_opcode);
-      PyObject *ret =
-          PyObject_CallMethod(trace_logic, "handle_opcode", "OOOO",
-                              (PyObject *)frame, opcode_object, callable, args);
+      call_handler(handle_opcode_method, (PyObject *)frame, opcode_object,
+                   callable, args);
       Py_DECREF(callable);
       Py_DECREF(args);
       Py_DECREF(opcode_object);
-      if (ret != NULL) {
-        Py_DECREF(ret);
-      } else {
-        print_stack_trace();
-      }
     }
     return 0;
   }
@@ -347,13 +385,7 @@ public:
         std::lock_guard<std::mutex> lock(cache_mutex);
         active_frames.insert(frame);
       }
-      PyObject *ret = PyObject_CallMethod(trace_logic, "handle_call", "O",
-                                          (PyObject *)frame);
-      if (ret != NULL) {
-        Py_DECREF(ret);
-      } else {
-        print_stack_trace();
-      }
+      call_handler(handle_call_method, (PyObject *)frame);
     }
     return 0;
   }
@@ -364,13 +396,7 @@ public:
       if (arg == NULL) {
         arg = Py_None;
       }
-      PyObject *ret = PyObject_CallMethod(trace_logic, "handle_return", "OO",
-                                          (PyObject *)frame, arg);
-      if (ret != NULL) {
-        Py_DECREF(ret);
-      } else {
-        print_stack_trace();
-      }
+      call_handler(handle_return_method, (PyObject *)frame, arg);
       active_frames.erase(frame);
     }
     return 0;
@@ -379,13 +405,7 @@ public:
   int handle_line_event(PyFrameObject *frame, PyObject *arg) {
     std::lock_guard<std::mutex> lock(cache_mutex);
     if (active_frames.find(frame) != active_frames.end()) {
-      PyObject *ret = PyObject_CallMethod(trace_logic, "handle_line", "O",
-                                          (PyObject *)frame);
-      if (ret != NULL) {
-        Py_DECREF(ret);
-      } else {
-        print_stack_trace();
-      }
+      call_handler(handle_line_method, (PyObject *)frame);
     }
     return 0;
   }
@@ -398,19 +418,16 @@ public:
                              &traceback)) {
         return -1;
       }
-      PyObject *ret = PyObject_CallMethod(trace_logic, "handle_exception",
-                                          "OOO", type, value, traceback);
-      if (ret != NULL) {
-        Py_DECREF(ret);
-      } else {
-        print_stack_trace();
-      }
+      // python层签名为handle_exception(exc_type, exc_value, frame)
+      call_handler(handle_exception_method, type, value, (PyObject *)frame);
     }
     return 0;
   }
 
-  void start() {
-    PyEval_SetTrace(&trace_dispatch_thunk, reinterpret_cast<PyObject *>(this));
+  // owner是持有本对象的python包装对象，PyEval_SetTrace会对其增加引用计数，
+  // 因此不能直接传入C++对象指针
+  void start(PyObject *owner) {
+    PyEval_SetTrace(&trace_dispatch_thunk, owner);
     PyObject *ret = PyObject_CallMethod(trace_logic, "start", nullptr);
     if (ret != NULL) {
       Py_DECREF(ret);
@@ -434,6 +451,15 @@ typedef struct {
   PyObject_HEAD TraceDispatcher *dispatcher;
 } TraceDispatcherObject;
 
+int TraceDispatcher::trace_dispatch_thunk(PyObject *self, PyFrameObject *frame,
+                                          int event, PyObject *arg) {
+  TraceDispatcher *dispatcher = ((TraceDispatcherObject *)self)->dispatcher;
+  if (dispatcher == nullptr) {
+    return 0;
+  }
+  return dispatcher->trace_dispatch(frame, event, arg);
+}
+
 static PyObject *TraceDispatcher_new(PyTypeObject *type, PyObject *args,
                                      PyObject *kwargs) {
   TraceDispatcherObject *self =
@@ -451,7 +477,7 @@ static PyObject *TraceDispatcher_start(PyObject *self, PyObject *args) {
     PyErr_SetString(PyExc_RuntimeError, "Invalid dispatcher");
     return nullptr;
   }
-  obj->dispatcher->start();
+  obj->dispatcher->start(self);
   Py_RETURN_NONE;
 }
 
@@ -491,7 +517,8 @@ static PyMethodDef TraceDispatcher_methods[] = {
     {nullptr, nullptr, 0, nullptr}};
 
 static void TraceDispatcher_dealloc(TraceDispatcherObject *self) {
-  self->dispatcher->~TraceDispatcher();
+  delete self->dispatcher;
+  self->dispatcher = nullptr;
   Py_TYPE(self)->tp_free((PyObject *)self);
 }
 
@@ -510,6 +537,11 @@ static int TraceDispatcher_init(TraceDispatcherObject *self, PyObject *args,
   }
 
   self->dispatcher = new TraceDispatcher(target_path, trace_logic, config);
+  if (!self->dispatcher->is_valid()) {
+    delete self->dispatcher;
+    self->dispatcher = nullptr;
+    return -1;
+  }
   return 0;
 }
 
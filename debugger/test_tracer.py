@@ -1,10 +1,14 @@
 import dis
+import fnmatch
 import inspect
 import json
 import os
+import re
 import shutil
 import sys
 import tempfile
+import threading
+import time
 import unittest
 from pathlib import Path
 from unittest.mock import Mock, patch
@@ -12,12 +16,17 @@ from unittest.mock import Mock, patch
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from debugger.tracer import (
+    _FLUSH_BATCH_SIZE,
     _MAX_VALUE_LENGTH,
     CallTreeHtmlRender,
+    SysMonitoringTraceDispatcher,
     TraceConfig,
     TraceDispatcher,
     TraceLogExtractor,
     TraceLogic,
+    TraceTypes,
+    _glob_to_linear_regex,
+    get_tracer,
     truncate_repr_value,
 )
 
@@ -85,6 +94,33 @@ class TestTraceConfig(unittest.TestCase):
         self.assertTrue(config.match_filename("/path/to/test.py"))
         self.assertFalse(config.match_filename("test.txt"))
 
+    def test_match_filename_skips_resolve_for_system_paths(self):
+        config = TraceConfig(target_files=["*.py"])
+        config._system_paths = {os.path.abspath("/opt/lib/python3/site-packages")}
+        with patch.object(Path, "resolve", side_effect=AssertionError("resolve called")):
+            self.assertFalse(config.match_filename("/opt/lib/python3/site-packages/pkg/mod.py"))
+            self.assertTrue(config.match_filename("/src/app.py"))
+
+    def test_match_filename_multiple_patterns(self):
+        config = TraceConfig(target_files=["*/foo_*.py", "*bar.py"], ignore_system_paths=False)
+        self.assertTrue(config.match_filename("/src/foo_a.py"))
+        self.assertTrue(config.match_filename("/src/bar.py"))
+        self.assertFalse(config.match_filename("/src/baz.py"))
+
+        config.target_files = ["*baz.py"]
+        self.assertTrue(config.match_filename("/src/baz.py"))
+        self.assertFalse(config.match_filename("/src/bar.py"))
+
+    def test_glob_to_linear_regex(self):
+        names = ["test_a.py", "/src/test_b.py", "abc", "abcd", "axc", "a.py", ""]
+        for pattern in ["*test_*.py", "abc", "a?c*", "**.py", "*"]:
+            regex = _glob_to_linear_regex(pattern)
+            self.assertNotIn("(?>", regex)
+            for name in names:
+                self.assertEqual(
+                    re.fullmatch(regex, name) is not None, fnmatch.fnmatchcase(name, pattern), (pattern, name)
+                )
+
     def test_parse_line_ranges(self):
         line_ranges = {"test.py": [(1, 3), (5, 7)]}
         config = TraceConfig(line_ranges=line_ranges)
@@ -103,6 +139,12 @@ class TestTraceConfig(unittest.TestCase):
         t = TraceConfig(capture_vars=invalid_exprs)
         self.assertFalse(t.validate())
 
+    def test_invalid_capture_vars_type_fails_validation(self):
+        for capture_vars in ("x.y", ["x", 1]):
+            config = TraceConfig(capture_vars=capture_vars)
+            self.assertEqual(config._compiled_capture, [])
+            self.assertFalse(config.validate())
+
 
 class TestTraceDispatcher(unittest.TestCase):
     def setUp(self):
@@ -216,6 +258,56 @@ class TestTraceDispatcher(unittest.TestCase):
         self.dispatcher.config.target_files = ["*测试_*.py"]
         self.assertTrue(self.dispatcher.is_target_frame(mock_frame))
 
+    def test_disable_line_trace_uses_setprofile(self):
+        config = TraceConfig(target_files=["*test_*.py"], disable_html=True, disable_line_trace=True)
+        dispatcher = TraceDispatcher(self.test_file, config)
+        with patch("sys.setprofile") as mock_setprofile, patch("sys.settrace") as mock_settrace:
+            dispatcher.start()
+            dispatcher.stop()
+        mock_setprofile.assert_any_call(dispatcher.trace_dispatch)
+        mock_setprofile.assert_called_with(None)
+        mock_settrace.assert_not_called()
+
+
+@unittest.skipUnless(sys.version_info >= (3, 12), "sys.monitoring requires Python 3.12+")
+class TestSysMonitoringTraceDispatcher(unittest.TestCase):
+    def test_flush_thread_not_traced(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config = TraceConfig(
+                target_files=["*.py"],
+                ignore_system_paths=False,
+                report_name=os.path.join(tmp_dir, "flush_thread.html"),
+            )
+            dispatcher = SysMonitoringTraceDispatcher(__file__, config)
+            logic = dispatcher._logic
+            call_threads = []
+            original_handle_call = logic.handle_call
+
+            def recording_handle_call(frame):
+                call_threads.append(threading.get_ident())
+                original_handle_call(frame)
+
+            logic.handle_call = recording_handle_call
+
+            def work(i):
+                return json.dumps({"value": i})
+
+            dispatcher.start()
+            try:
+                for i in range(20):
+                    work(i)
+                # 唤醒刷新线程，让它在跟踪期间执行json/html等标准库调用
+                logic._flush_event.set()
+                deadline = time.monotonic() + 5
+                while logic._log_queue and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                flush_ident = logic._timer_thread.ident
+            finally:
+                dispatcher.stop()
+
+        self.assertTrue(call_threads)
+        self.assertNotIn(flush_ident, call_threads)
+
 
 class TestTraceLogic(unittest.TestCase):
     def setUp(self):
@@ -232,10 +324,105 @@ class TestTraceLogic(unittest.TestCase):
         self.logic.handle_return(self.frame, "test")
         self.assertEqual(self.logic.stack_depth, 0)
 
+    def test_handle_return_releases_frame_id(self):
+        self.logic.handle_call(self.frame)
+        frame_id = self.logic._get_frame_id(self.frame)
+        self.logic.handle_return(self.frame, None)
+        self.assertNotIn(id(self.frame), self.logic._frame_data._frame_id_map)
+        self.assertNotEqual(self.logic._get_frame_id(self.frame), frame_id)
+
+    def test_generator_keeps_frame_id_across_yields(self):
+        def gen():
+            yield 1
+            yield 2
+
+        frame_ids = []
+        frames = []
+
+        def tracer(frame, event, arg):
+            if frame.f_code is not gen.__code__:
+                return None
+            if event == "call":
+                self.logic.handle_call(frame)
+                frame_ids.append(self.logic._get_frame_id(frame))
+                frames.append(frame)
+            elif event == "return":
+                self.logic.handle_return(frame, arg)
+            return tracer
+
+        old_trace = sys.gettrace()
+        sys.settrace(tracer)
+        try:
+            self.assertEqual(list(gen()), [1, 2])
+        finally:
+            sys.settrace(old_trace)
+        # 首次调用加两次恢复执行，始终是同一个帧ID
+        self.assertEqual(len(frame_ids), 3)
+        self.assertEqual(len(set(frame_ids)), 1)
+        # 生成器真正返回后释放帧ID
+        self.assertNotIn(id(frames[0]), self.logic._frame_data._frame_id_map)
+
+    def test_closed_generator_releases_frame_id(self):
+        def gen():
+            try:
+                yield 1
+                yield 2
+            finally:
+                pass
+
+        frame_keys = []
+
+        def tracer(frame, event, arg):
+            if frame.f_code is not gen.__code__:
+                return None
+            if event == "call":
+                self.logic.handle_call(frame)
+                frame_keys.append(id(frame))
+            elif event == "exception":
+                self.logic.handle_exception(arg[0], arg[1], frame)
+            elif event == "return":
+                self.logic.handle_return(frame, arg)
+            return tracer
+
+        old_trace = sys.gettrace()
+        sys.settrace(tracer)
+        try:
+            g = gen()
+            next(g)
+            g.close()
+        finally:
+            sys.settrace(old_trace)
+        # 在yield处被close()后不再保留帧ID，避免复用同一id()的新帧沿用
+        self.assertTrue(frame_keys)
+        self.assertNotIn(frame_keys[0], self.logic._frame_data._frame_id_map)
+        self.assertNotIn(frame_keys[0], self.logic._frame_data._raised_at)
+
     def test_handle_line(self):
         self.logic.stack_depth = 1
         self.logic.handle_line(self.frame)
 
+    def test_get_source_line(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+            f.write("a = 1\nb = 2\n")
+        try:
+            self.assertEqual(self.logic._get_source_line(f.name, 2), "b = 2")
+            self.assertEqual(self.logic._get_source_line(f.name, 3), "")
+            self.assertIn(f.name, self.logic._file_cache._source_lines)
+        finally:
+            os.unlink(f.name)
+
+    def test_file_has_trace_comments(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as plain:
+            plain.write("a = 1  # comment\n")
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as traced:
+            traced.write("a = 1\nb = a  # trace a + 1\n")
+        try:
+            self.assertFalse(self.logic._file_has_trace_comments(plain.name))
+            self.assertTrue(self.logic._file_has_trace_comments(traced.name))
+        finally:
+            os.unlink(plain.name)
+            os.unlink(traced.name)
+
     def test_handle_exception(self):
         try:
             raise ValueError("test error")
@@ -252,6 +439,41 @@ class TestTraceLogic(unittest.TestCase):
         self.assertEqual(result["x"], "42")
         self.assertEqual(result["y['z']"], "'test'")
 
+    def test_capture_variables_invalid_expression(self):
+        frame = inspect.currentframe()
+        x = 42
+        self.config.capture_vars = ["x", "x."]
+        self.assertIsNone(self.config._compiled_capture[1][1])
+        result = self.logic.capture_variables(frame)
+        self.assertEqual(result["x"], "42")
+        self.assertIn("求值错误", result["x."])
+
+    def test_trace_expression_cached_by_location(self):
+        frame = inspect.currentframe()
+        x = 7
+        self.assertIsNone(self.logic._get_trace_expression("a.py", 1, "x = 1"))
+        self.logic._process_trace_expression(frame, "y = x  # trace x * 2", "a.py", 2)
+        expr, compiled = self.logic._file_cache._trace_expressions[("a.py", 2)]
+        self.assertEqual(expr, "x * 2")
+        self.assertEqual(eval(compiled, {}, {"x": x}), 14)  # nosec
+        log_data, _ = self.logic._log_queue[-1]
+        self.assertEqual(log_data["data"]["value"], "14")
+
+    def test_flush_thread_drains_full_batch(self):
+        self.logic.disable_output("html")
+        self.logic.start_flush_thread()
+        try:
+            self.assertTrue(self.logic._timer_thread.is_alive())
+            for _ in range(_FLUSH_BATCH_SIZE):
+                self.logic._add_to_buffer({"template": "x", "data": {}}, TraceTypes.COLOR_LINE)
+            for _ in range(100):
+                if not self.logic._log_queue:
+                    break
+                self.logic._timer_thread.join(0.01)
+            self.assertFalse(self.logic._log_queue)
+        finally:
+            self.logic.stop()
+
     def test_output_handlers(self):
         test_msg = {"template": "test {value}", "data": {"value": 42}}
 
@@ -270,6 +492,39 @@ class TestTraceLogic(unittest.TestCase):
             self.assertIn("test 42", content)
 
 
+class TestGetTracer(unittest.TestCase):
+    @patch("debugger.tracer.importlib.util.spec_from_file_location")
+    @patch("debugger.tracer.importlib.util.module_from_spec")
+    @patch("debugger.tracer.os.path.exists", return_value=True)
+    @patch("debugger.tracer.sys.version_info", (3, 11, 0))
+    def test_failed_extension_leaves_no_flush_thread(self, _exists, mock_module, _spec):
+        mock_module.return_value.TraceDispatcher.side_effect = RuntimeError("boom")
+        with (
+            patch.object(TraceLogic, "start_flush_thread") as mock_start,
+            patch.object(
+                TraceLogic, "disable_output", autospec=True, side_effect=TraceLogic.disable_output
+            ) as mock_disable,
+        ):
+            self.assertIsNone(get_tracer("demo.py", TraceConfig()))
+        mock_start.assert_not_called()
+        mock_disable.assert_called_once()
+        self.assertEqual(mock_disable.call_args.args[1], "file")
+
+    @unittest.skipUnless(
+        sys.version_info[:2] == (3, 11) and (Path(__file__).parent / "tracer_core.so").exists(),
+        "tracer_core extension not built",
+    )
+    def test_native_add_target_frame_skips_non_target(self):
+        config = TraceConfig(target_files=["*/no_such_target.py"], disable_html=True)
+        tracer = get_tracer("demo.py", config)
+        self.assertIsNotNone(tracer)
+        frame = sys._getframe()
+        frame.f_trace_lines = True
+        tracer.add_target_frame(frame)
+        self.assertFalse(frame.f_trace_lines)
+        tracer.stop()
+
+
 class TestCallTreeHtmlRender(unittest.TestCase):
     def setUp(self):
         self.config = TraceConfig()
@@ -294,6 +549,33 @@ class TestCallTreeHtmlRender(unittest.TestCase):
         self.assertIn("test&nbsp;message", generated_html)
         self.assertIn("Python Trace Report", generated_html)
 
+    def test_spill_rendered_messages(self):
+        self.logic._message_id = 4
+        with patch("debugger.tracer._HTML_SPILL_THRESHOLD", 4):
+            for idx in range(1, 5):
+                self.render.add_raw_message(
+                    {"idx": idx, "template": "line {n}", "data": {"n": idx}}, TraceTypes.COLOR_LINE
+                )
+        # 最新的行消息可能还会追加栈变量，保留在内存中
+        self.assertEqual([m[0] for m in self.render._messages], ["line 4"])
+        self.assertIsNotNone(self.render._spill_file)
+        generated_html = self.render.generate_html()
+        self.assertEqual(generated_html, self.render.generate_html())
+        positions = [generated_html.index(f"line&nbsp;{n}") for n in range(1, 5)]
+        self.assertEqual(positions, sorted(positions))
+        self.assertIn("Total messages: 4", generated_html)
+
+    def test_source_files_embedded_as_text(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False, encoding="utf-8") as tmp:
+            tmp.write('s = "</script>"\n')
+        try:
+            self.render._load_source_file(tmp.name)
+            self.assertEqual(self.render._source_files[tmp.name], 's = "</script>"\n')
+            generated_html = self.render.generate_html()
+            self.assertIn('s = \\"<\\/script>\\"', generated_html)
+        finally:
+            os.unlink(tmp.name)
+
     def test_save_to_file(self):
         with tempfile.NamedTemporaryFile(suffix=".html", delete=False) as tmp:
             tmp.close()
@@ -302,8 +584,16 @@ class TestCallTreeHtmlRender(unittest.TestCase):
             with open(tmp.name, encoding="utf-8") as f:
                 content = f.read()
             self.assertIn("test&nbsp;message", content)
+            self.assertIsNone(self.render._spill_file)
             os.unlink(tmp.name)
 
+    def test_message_count_excludes_skipped_messages(self):
+        self.render._size_limit = 1
+        for n in range(3):
+            self.render.add_message(f"message {n}", "call", {})
+        generated_html = self.render.generate_html()
+        self.assertIn("Total messages: 0", generated_html)
+
 
 class TestIntegration(unittest.TestCase):
     def test_full_trace_cycle(self):
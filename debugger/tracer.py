@@ -1,5 +1,4 @@
 import ast
-import base64
 import datetime
 import dis
 import fnmatch
@@ -7,23 +6,30 @@ import functools
 import html
 import importlib.util
 import inspect
+import io
+import itertools
 import json
 import linecache
 import logging
 import os
-import queue
+import re
+import shutil
 import sys
+import tempfile
 import threading
-import time
 import traceback
-from collections import defaultdict
+from collections import defaultdict, deque
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple, Union
 from unittest.mock import Mock
 
-import yaml
 from colorama import Fore, Style, just_fix_windows_console
 
+try:
+    import re2  # 可选依赖google-re2，提供线性时间的DFA匹配
+except ImportError:
+    re2 = None
+
 just_fix_windows_console()
 
 if TYPE_CHECKING:
@@ -50,6 +56,9 @@ if TYPE_CHECKING:
         def set_events(self, tool_id: int, event_set: int) -> None: ...
         def register_callback(self, tool_id: int, event: int, callback: Callable[..., Any]) -> None: ...
         def free_tool_id(self, tool_id: int) -> None: ...
+        def restart_events(self) -> None: ...
+
+        DISABLE: object
 
 
 # Constants
@@ -61,6 +70,26 @@ TRACE_LOG_NAME = _LOG_DIR / "trace.log"
 LOG_NAME = _LOG_DIR / "debug.log"
 _MAX_CALL_DEPTH = 20
 _DEFAULT_REPORT_NAME = "trace_report.html"
+# 生成器/协程在yield处暂停时settrace也会产生return事件，帧恢复后仍是同一帧
+_GENERATOR_FLAGS = inspect.CO_GENERATOR | inspect.CO_COROUTINE | inspect.CO_ASYNC_GENERATOR
+_YIELD_OPCODES = frozenset(dis.opmap[name] for name in ("YIELD_VALUE", "YIELD_FROM") if name in dis.opmap)
+_TRACER_CORE_NAME = "tracer_core.pyd" if os.name == "nt" else "tracer_core.so"
+_ESCAPE_CACHE_SIZE = 4096
+_HTML_SPILL_THRESHOLD = 8192
+_LOG_BUFFER_SIZE = 1 << 20
+_FLUSH_BATCH_SIZE = 4096
+_FLUSH_INTERVAL = 1.0
+_SCALAR_TYPES = frozenset((int, float, complex, bool, str, bytes, type(None)))
+_INDENT_CACHE_SIZE = 64
+_INDENT_CACHE = tuple(_INDENT * depth for depth in range(_INDENT_CACHE_SIZE))
+
+# 各事件的日志模板，格式化推迟到刷新输出时进行
+_CALL_TEMPLATE = "{indent}↘ {prefix} {filename}:{lineno} {func}({args}) [frame:{frame_id}]"
+_RETURN_TEMPLATE = "{indent}↗ RETURN {filename} {func}() → {return_value} [frame:{frame_id}]"
+_LINE_TEMPLATE = "{indent}▷ {filename}:{lineno} {line}"
+_TRACE_EXPR_TEMPLATE = "{indent}↳ Debug Statement {expr}={value} [frame:{frame_id}]"
+_CAPTURED_VARS_TEMPLATE = "{indent}↳ 变量: {vars} [frame:{frame_id}]"
+_EXCEPTION_TEMPLATE = "{indent}⚠ EXCEPTION IN {func} AT {filename}:{lineno} {exc_type}: {exc_value} [frame:{frame_id}]"
 
 
 # Trace types
@@ -105,13 +134,36 @@ class TraceTypes:
 
 # 该字典已被colorama替代
 
-logging.basicConfig(
-    filename=str(LOG_NAME),
-    level=logging.DEBUG,
-    format="%(asctime)s.%(msecs)03d - %(levelname)s - %(message)s",
-    datefmt="%H:%M:%S",
-    filemode="w",
+# 使用独立logger而非basicConfig配置root logger，避免影响宿主程序，也不再为DEBUG记录做格式化
+logger = logging.getLogger("tracer")
+_log_handler = logging.FileHandler(str(LOG_NAME), mode="w", encoding="utf-8")
+_log_handler.setFormatter(
+    logging.Formatter("%(asctime)s.%(msecs)03d - %(levelname)s - %(message)s", datefmt="%H:%M:%S")
 )
+logger.addHandler(_log_handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+
+def _glob_to_linear_regex(pattern: str) -> str:
+    """将通配符翻译为不含回溯结构(原子组/前瞻)的正则，供RE2使用，需配合fullmatch"""
+    prefix, suffix = "(?s:", ")\\Z"
+    chunks = []
+    for chunk in pattern.split("*"):
+        translated = fnmatch.translate(chunk)
+        chunks.append(translated[len(prefix) : -len(suffix)])
+    return "(?s:%s)" % ".*".join(chunks)
+
+
+def _compile_globs(patterns: List[str]):
+    """将通配符列表编译为单个正则；安装了google-re2时优先使用RE2，否则回退到标准库re"""
+    # 字符集中可能包含"*"，无法安全按"*"拆分，交给标准库处理
+    if re2 is not None and not any("[" in pattern for pattern in patterns):
+        try:
+            return re2.compile("|".join(f"(?:{_glob_to_linear_regex(pattern)})" for pattern in patterns))
+        except re2.error as e:
+            logger.debug("RE2编译失败，回退到re: %s", str(e))
+    return re.compile("|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in patterns))
 
 
 class TraceConfig:
@@ -130,6 +182,7 @@ class TraceConfig:
         ignore_system_paths: bool = True,
         start_function: Tuple[str, int] = None,
         disable_html: bool = False,
+        disable_line_trace: bool = False,
     ):
         """
         初始化跟踪配置
@@ -142,6 +195,7 @@ class TraceConfig:
             exclude_functions: 要排除的函数名列表
             enable_var_trace: 是否启用变量操作跟踪
             ignore_system_paths: 是否忽略系统路径和第三方包路径
+            disable_line_trace: 是否只记录调用/返回，不产生行事件，开销不再随循环次数增长
         """
         self.target_files = target_files or []
         self.line_ranges = self._parse_line_ranges(line_ranges or {})
@@ -151,11 +205,45 @@ class TraceConfig:
         self.enable_var_trace = enable_var_trace
         self.ignore_self = ignore_self
         self.ignore_system_paths = ignore_system_paths
-        self._compiled_patterns = [fnmatch.translate(pattern) for pattern in self.target_files]
         self._system_paths = self._get_system_paths() if ignore_system_paths else set()
         self.report_name = report_name if report_name else _DEFAULT_REPORT_NAME
         self.start_function = start_function
         self.disable_html = disable_html
+        self.disable_line_trace = disable_line_trace
+
+    @property
+    def target_files(self) -> List[str]:
+        return self._target_files
+
+    @target_files.setter
+    def target_files(self, patterns: List[str]):
+        """设置目标文件模式，同时预编译为单个正则避免每次匹配时重复翻译通配符"""
+        self._target_files = patterns
+        if patterns:
+            self._compiled_patterns = _compile_globs([os.path.normcase(pattern) for pattern in patterns])
+        else:
+            self._compiled_patterns = None
+
+    @property
+    def capture_vars(self) -> List[str]:
+        return self._capture_vars
+
+    @capture_vars.setter
+    def capture_vars(self, expressions: List[str]):
+        """设置捕获表达式，同时预编译为code对象，非法表达式保留为None在求值时报告错误"""
+        self._capture_vars = expressions
+        # 类型不合法时留给validate()报告，不在这里编译
+        if isinstance(expressions, list) and all(isinstance(expr, str) for expr in expressions):
+            self._compiled_capture = [(expr, self._compile_capture_expr(expr)) for expr in expressions]
+        else:
+            self._compiled_capture = []
+
+    @staticmethod
+    def _compile_capture_expr(expr: str):
+        try:
+            return compile(ast.parse(expr, mode="eval"), "<capture>", "eval")
+        except (SyntaxError, ValueError, TypeError):
+            return None
 
     @staticmethod
     def _get_system_paths() -> Set[str]:
@@ -163,7 +251,8 @@ class TraceConfig:
         system_paths = set()
         for path in sys.path:
             try:
-                resolved = str(Path(path).resolve())
+                # 与match_filename一致只做abspath规范化，避免resolve()的realpath/stat开销
+                resolved = os.path.abspath(path)
                 if any(
                     part.startswith(("site-packages", "dist-packages", "python")) or "lib/python" in resolved.lower()
                     for part in Path(resolved).parts
@@ -182,17 +271,17 @@ class TraceConfig:
             return False
         if self.ignore_system_paths:
             try:
-                resolved = str(Path(filename).resolve())
-                if any(resolved.startswith(sys_path) for sys_path in self._system_paths):
+                normalized = os.path.abspath(filename)
+                if any(normalized.startswith(sys_path) for sys_path in self._system_paths):
                     return False
             except (ValueError, OSError):
                 pass
 
-        if not self.target_files:
+        if self._compiled_patterns is None:
             return True
 
-        filename_posix = Path(filename).as_posix()
-        return any(fnmatch.fnmatch(filename_posix, pattern) for pattern in self.target_files)
+        filename_posix = os.path.normcase(Path(filename).as_posix())
+        return self._compiled_patterns.fullmatch(filename_posix) is not None
 
     @classmethod
     def from_yaml(cls, config_path: Union[str, Path]) -> "TraceConfig":
@@ -213,9 +302,17 @@ class TraceConfig:
         if not config_path.exists():
             raise FileNotFoundError(f"配置文件不存在: {config_path}")
 
+        # yaml只在加载配置文件时需要，延迟导入以降低模块导入开销
+        import yaml
+
+        try:
+            from yaml import CSafeLoader as safe_loader
+        except ImportError:
+            from yaml import SafeLoader as safe_loader
+
         try:
             with open(config_path, "r", encoding="utf-8") as f:
-                config_data = yaml.safe_load(f)
+                config_data = yaml.load(f.read(), Loader=safe_loader)  # nosec - safe loader
         except yaml.YAMLError as e:
             raise ValueError(f"配置文件解析失败: {str(e)}") from e
 
@@ -229,6 +326,7 @@ class TraceConfig:
             callback=config_data.get("callback", None),
             exclude_functions=config_data.get("exclude_functions", []),
             ignore_system_paths=config_data.get("ignore_system_paths", True),
+            disable_line_trace=config_data.get("disable_line_trace", False),
         )
 
     @staticmethod
@@ -298,12 +396,13 @@ class TraceConfig:
             is_valid = False
         if not isinstance(self.line_ranges, dict):
             is_valid = False
-        if not isinstance(self.capture_vars, list):
-            is_valid = False
-        try:
-            self._validate_expressions(self.capture_vars)
-        except ValueError:
+        if not isinstance(self.capture_vars, list) or not all(isinstance(expr, str) for expr in self.capture_vars):
             is_valid = False
+        else:
+            try:
+                self._validate_expressions(self.capture_vars)
+            except ValueError:
+                is_valid = False
         for _, ranges in self.line_ranges.items():
             if not all(isinstance(r, tuple) and len(r) == 2 for r in ranges):
                 is_valid = False
@@ -319,22 +418,14 @@ class TraceConfig:
 def _truncate_sequence(value, keep_elements):
     if len(value) <= keep_elements:
         return repr(value)
-    keep_list = []
-    for i in range(keep_elements):
-        keep_list.append(value[i])
+    keep_list = list(itertools.islice(value, keep_elements))
     return f"{repr(keep_list)[:-1]} ...]"
 
 
 def _truncate_dict(value, keep_elements):
     if len(value) <= keep_elements:
         return repr(value)
-    keep_dict = {}
-    i = keep_elements
-    it = iter(value)
-    while i > 0 and value:
-        key = next(it)
-        keep_dict[key] = value[key]
-        i -= 1
+    keep_dict = dict(itertools.islice(value.items(), keep_elements))
     s = repr(keep_dict)
     return "%s ...}" % s[:-1]
 
@@ -342,13 +433,7 @@ def _truncate_dict(value, keep_elements):
 def _truncate_object(value, keep_elements):
     if len(value.__dict__) <= keep_elements:
         return f"{type(value).__name__}.({repr(value.__dict__)})"
-    keep_attrs = {}
-    i = keep_elements
-    it = iter(value.__dict__)
-    while i > 0 and value.__dict__:
-        key = next(it)
-        keep_attrs[key] = value.__dict__[key]
-        i -= 1
+    keep_attrs = dict(itertools.islice(value.__dict__.items(), keep_elements))
     s = repr(keep_attrs)
     return f"{type(value).__name__}(%s ...)" % s[:-1]
 
@@ -357,8 +442,16 @@ def truncate_repr_value(value, keep_elements=10):
     """智能截断保留关键类型信息"""
     preview = "..."
     try:
+        # 常见内置类型直接按type身份判断，避免isinstance与hasattr链
+        value_type = type(value)
+        if value_type in _SCALAR_TYPES:
+            preview = repr(value)
+        elif value_type is list or value_type is tuple:
+            preview = _truncate_sequence(value, keep_elements)
+        elif value_type is dict:
+            preview = _truncate_dict(value, keep_elements)
         # 检测是否是unittest.mock.Mock对象
-        if isinstance(value, Mock):
+        elif isinstance(value, Mock):
             preview = f"mock.Mock({value.__class__})"
         elif isinstance(value, (list, tuple)):
             preview = _truncate_sequence(value, keep_elements)
@@ -379,9 +472,9 @@ def truncate_repr_value(value, keep_elements=10):
     return preview
 
 
-def color_wrap(text, color_type):
-    """包装颜色但不影响日志文件"""
-    color_mapping = {
+_COLOR_WRAP = {
+    color_type: (prefix, Style.RESET_ALL)
+    for color_type, prefix in {
         TraceTypes.COLOR_CALL: Fore.GREEN,
         TraceTypes.COLOR_RETURN: Fore.BLUE,
         TraceTypes.COLOR_VAR: Fore.YELLOW,
@@ -389,8 +482,15 @@ def color_wrap(text, color_type):
         TraceTypes.COLOR_ERROR: Fore.RED,
         TraceTypes.COLOR_TRACE: Fore.MAGENTA,
         TraceTypes.COLOR_RESET: Style.RESET_ALL,
-    }
-    return f"{color_mapping.get(color_type, '')}{text}{Style.RESET_ALL}"
+    }.items()
+}
+_COLOR_WRAP_DEFAULT = ("", Style.RESET_ALL)
+
+
+def color_wrap(text, color_type):
+    """包装颜色但不影响日志文件"""
+    prefix, suffix = _COLOR_WRAP.get(color_type, _COLOR_WRAP_DEFAULT)
+    return f"{prefix}{text}{suffix}"
 
 
 class TraceDispatcher:
@@ -399,12 +499,18 @@ class TraceDispatcher:
         self.config = config
         self.path_cache = {}
         self._logic = TraceLogic(config)
-        self.active_frames = set()
+        self.active_frames = set()  # 存放frame的id，避免持有frame引用延长其生命周期
         self.bad_frame = None
+        self._event_handlers = {
+            TraceTypes.CALL: self._handle_call_event,
+            TraceTypes.RETURN: self._handle_return_event,
+            TraceTypes.LINE: self._handle_line_event,
+            TraceTypes.EXCEPTION: self._handle_exception_event,
+        }
 
     def add_target_frame(self, frame):
         if self.is_target_frame(frame):
-            self.active_frames.add(frame)
+            self.active_frames.add(id(frame))
 
     def is_target_frame(self, frame):
         """精确匹配目标模块路径"""
@@ -413,41 +519,36 @@ class TraceDispatcher:
                 frame.f_trace_lines = False
                 return False
             filename = frame.f_code.co_filename
-            result = self.path_cache.get(filename, None)
-            if result is not None:
-                if result is False:
-                    frame.f_trace_lines = False
-                return result
-            frame_path = Path(filename).resolve()
-            matched = self.config.match_filename(str(frame_path))
-            self.path_cache[filename] = matched
+            path_cache = self.path_cache
+            try:
+                matched = path_cache[filename]
+            except KeyError:
+                # 纯字符串规范化即可用于通配符匹配，避免resolve()触发文件系统调用
+                matched = self.config.match_filename(os.path.abspath(filename))
+                path_cache[filename] = matched
             if not matched:
                 frame.f_trace_lines = False
             return matched
         except (AttributeError, ValueError, OSError) as e:
-            logging.debug("Frame check error: %s", str(e))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Frame check error: %s", str(e))
             return False
 
     def trace_dispatch(self, frame, event, arg):
         """事件分发器"""
-        if event == TraceTypes.CALL:
-            return self._handle_call_event(frame)
-        if event == TraceTypes.RETURN:
-            return self._handle_return_event(frame, arg)
-        if event == TraceTypes.LINE:
-            return self._handle_line_event(frame)
-        if event == TraceTypes.EXCEPTION:
-            return self._handle_exception_event(frame, arg)
-        return None
+        handler = self._event_handlers.get(event)
+        if handler is None:
+            return None
+        return handler(frame, arg)
 
-    def _handle_call_event(self, frame, arg=None):
+    def _handle_call_event(self, frame, arg):
         """处理函数调用事件"""
         if frame.f_code.co_name in self.config.exclude_functions:
             frame.f_trace_lines = False
             self.bad_frame = frame
             return None
         if self.is_target_frame(frame):
-            self.active_frames.add(frame)
+            self.active_frames.add(id(frame))
             self._logic.handle_call(frame)
         return self.trace_dispatch
 
@@ -455,16 +556,16 @@ class TraceDispatcher:
         """处理函数返回事件"""
         if frame == self.bad_frame:
             self.bad_frame = None
-        if frame in self.active_frames:
+        if id(frame) in self.active_frames:
             self._logic.handle_return(frame, arg)
-            self.active_frames.discard(frame)
+            self.active_frames.discard(id(frame))
         return self.trace_dispatch
 
-    def _handle_line_event(self, frame, arg=None):
+    def _handle_line_event(self, frame, arg):
         """处理行号事件"""
         if self.bad_frame:
             return self.trace_dispatch
-        if frame in self.active_frames:
+        if id(frame) in self.active_frames:
             self._logic.handle_line(frame)
         return self.trace_dispatch
 
@@ -472,22 +573,29 @@ class TraceDispatcher:
         """处理异常事件"""
         if self.bad_frame:
             return self.trace_dispatch
-        if frame in self.active_frames:
+        if id(frame) in self.active_frames:
             exc_type, exc_value, _ = arg
             self._logic.handle_exception(exc_type, exc_value, frame)
         return self.trace_dispatch
 
     def start(self):
-        """启动跟踪"""
+        """启动跟踪，禁用行跟踪时改用只在调用/返回时触发的setprofile"""
         self._logic.start_flush_thread()
-        sys.settrace(self.trace_dispatch)
+        if self.config.disable_line_trace:
+            sys.setprofile(self.trace_dispatch)
+        else:
+            sys.settrace(self.trace_dispatch)
         self._logic.start()
 
     def stop(self):
         """停止跟踪"""
-        sys.settrace(None)
+        if self.config.disable_line_trace:
+            sys.setprofile(None)
+        else:
+            sys.settrace(None)
+        self.active_frames.clear()
         self._logic.stop()
-        logging.info("⏹ DEBUG SESSION ENDED\n")
+        logger.info("⏹ DEBUG SESSION ENDED\n")
         print(color_wrap("\n⏹ 调试会话结束", TraceTypes.COLOR_RETURN))
 
 
@@ -499,7 +607,7 @@ class SysMonitoringTraceDispatcher:
         self.config = config
         self.path_cache = {}
         self._logic = TraceLogic(config)
-        self.active_frames = set()
+        self.active_frames = set()  # 存放frame的id，避免持有frame引用延长其生命周期
         self.bad_frame = None
         self._tool_id = None
         self._registered = False
@@ -532,7 +640,6 @@ class SysMonitoringTraceDispatcher:
                 self.monitoring_module.events.PY_START
                 | self.monitoring_module.events.PY_RETURN
                 | self.monitoring_module.events.PY_YIELD
-                | self.monitoring_module.events.LINE
                 | self.monitoring_module.events.RAISE
                 | self.monitoring_module.events.RERAISE
                 | self.monitoring_module.events.EXCEPTION_HANDLED
@@ -540,6 +647,8 @@ class SysMonitoringTraceDispatcher:
                 | self.monitoring_module.events.PY_RESUME
                 | self.monitoring_module.events.PY_THROW
             )
+            if not self.config.disable_line_trace:
+                events |= self.monitoring_module.events.LINE
 
             self.monitoring_module.set_events(self._tool_id, events)
 
@@ -593,7 +702,7 @@ class SysMonitoringTraceDispatcher:
             )
 
         except Exception as e:
-            logging.error("Failed to register monitoring tool: %s", str(e))
+            logger.error("Failed to register monitoring tool: %s", str(e))
             raise
 
     def _unregister_tool(self):
@@ -618,16 +727,23 @@ class SysMonitoringTraceDispatcher:
             # Disable all events
             self.monitoring_module.set_events(self._tool_id, self.monitoring_module.events.NO_EVENTS)
 
+            # Re-enable locations disabled via DISABLE so a later session starts clean
+            self.monitoring_module.restart_events()
+
             # Free the tool ID
             self.monitoring_module.free_tool_id(self._tool_id)
             self._registered = False
             self._tool_id = None
 
         except Exception as e:
-            logging.error("Failed to unregister monitoring tool: %s", str(e))
+            logger.error("Failed to unregister monitoring tool: %s", str(e))
 
     def _handle_py_start(self, _code, _offset):
         """Handle PY_START event (function entry)"""
+        # sys.monitoring会上报所有线程的事件，跳过刷新线程自身的json/html/tempfile调用；
+        # 不能返回DISABLE，否则会关闭所有线程在该代码位置的事件
+        if self._logic.is_flush_thread():
+            return None
         frame = sys._getframe(1)  # Get the frame of the function being called
 
         if not self.is_target_frame(frame):
@@ -635,7 +751,7 @@ class SysMonitoringTraceDispatcher:
 
         # If we're already tracing after finding the start function
         if self.start_function and self.start_at_enable:
-            self.active_frames.add(frame)
+            self.active_frames.add(id(frame))
             self._logic.handle_call(frame)
             return None
 
@@ -644,45 +760,54 @@ class SysMonitoringTraceDispatcher:
             filename, line_number = self.start_function
             if frame.f_code.co_filename == filename and frame.f_lineno == line_number:
                 self.start_at_enable = True
-                self.active_frames.add(frame)
+                self.active_frames.add(id(frame))
                 self._logic.handle_call(frame)
             else:
                 return self.monitoring_module.DISABLE
         # No start function specified, trace everything
         else:
-            self.active_frames.add(frame)
+            self.active_frames.add(id(frame))
             self._logic.handle_call(frame)
 
     def _handle_py_resume(self, _code, _offset):
         """Handle PY_RESUME event (function resume)"""
         # frame = sys._getframe(1)
-        # if frame in self.active_frames:
+        # if id(frame) in self.active_frames:
         #     print(" resume in active frame: %s", frame)
         pass
 
-    def _handle_py_return(self, _code, _offset, retval):
+    def _is_untraced_code(self, code):
+        """Check whether code belongs to a file already known not to match target files"""
+        return self.path_cache.get(code.co_filename) is False
+
+    def _handle_py_return(self, code, _offset, retval):
         """Handle PY_RETURN event (function return)"""
         frame = sys._getframe(1)
-        if frame in self.active_frames:
+        if id(frame) in self.active_frames:
             self._logic.handle_return(frame, retval)
-            self.active_frames.discard(frame)
+            self.active_frames.discard(id(frame))
+        elif self._is_untraced_code(code):
+            return self.monitoring_module.DISABLE
 
-    def _handle_line(self, _code, _line_number):
+    def _handle_line(self, code, _line_number):
         """Handle LINE event"""
         frame = sys._getframe(1)  # Get the current frame
-        if frame in self.active_frames:
+        if id(frame) in self.active_frames:
             self._logic.handle_line(frame)
+        elif self._is_untraced_code(code):
+            # Stop the interpreter from firing this line again for non-target files
+            return self.monitoring_module.DISABLE
 
     def _handle_raise(self, _code, _offset, exc):
         """Handle RAISE event (exception raised)"""
         frame = sys._getframe(1)  # Get the frame where exception was raised
-        if frame in self.active_frames:
+        if id(frame) in self.active_frames:
             self._logic.handle_exception(type(exc), exc, frame)
 
     def _handle_exception_handled(self, _code, _offset, exc):
         """Handle EXCEPTION_HANDLED event"""
         frame = sys._getframe(1)  # Get the frame where exception was handled
-        if frame in self.active_frames:
+        if id(frame) in self.active_frames:
             if len(self._logic.exception_chain) > 0:
                 self._logic.exception_chain.pop()
             self._logic.stack_depth += 1
@@ -690,7 +815,7 @@ class SysMonitoringTraceDispatcher:
     def _handle_py_yield(self, _code, _offset, value):
         """Handle PY_YIELD event (generator yield)"""
         # frame = sys._getframe(1)
-        # if frame in self.active_frames:
+        # if id(frame) in self.active_frames:
         #     func_name = frame.f_code.co_name
         #     pass
         pass
@@ -698,20 +823,21 @@ class SysMonitoringTraceDispatcher:
     def _handle_py_throw(self, _code, _offset, exc):
         """Handle PY_THROW event (generator throw)"""
         frame = sys._getframe(1)
-        if frame in self.active_frames:
+        if id(frame) in self.active_frames:
             self._logic.handle_exception(type(exc), exc, frame)
 
     def _handle_py_unwind(self, *args):
         """Handle PY_UNWIND event (stack unwinding)"""
         frame = sys._getframe(1)
-        if frame in self.active_frames:
+        if id(frame) in self.active_frames:
             self._logic.flush_exception()
-            self.active_frames.discard(frame)
+            self._logic.release_frame(frame)
+            self.active_frames.discard(id(frame))
 
     def _handle_reraise(self, _code, _offset, exc):
         """Handle RERAISE event (exception re-raised)"""
         frame = sys._getframe(1)
-        if frame in self.active_frames:
+        if id(frame) in self.active_frames:
             self._logic.handle_exception(type(exc), exc, frame)
 
     def is_target_frame(self, frame):
@@ -723,23 +849,25 @@ class SysMonitoringTraceDispatcher:
                 return False
 
             filename = frame.f_code.co_filename
-            result = self.path_cache.get(filename, None)
-            if result is not None:
-                return result
+            path_cache = self.path_cache
+            try:
+                return path_cache[filename]
+            except KeyError:
+                pass
 
-            frame_path = Path(filename).resolve()
-            matched = self.config.match_filename(str(frame_path))
-            self.path_cache[filename] = matched
+            matched = self.config.match_filename(os.path.abspath(filename))
+            path_cache[filename] = matched
             return matched
 
         except (AttributeError, ValueError, OSError) as e:
-            logging.debug("Frame check error: %s", str(e))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Frame check error: %s", str(e))
             return False
 
     def add_target_frame(self, frame):
         """Add a frame to be monitored"""
         if self.is_target_frame(frame):
-            self.active_frames.add(frame)
+            self.active_frames.add(id(frame))
 
     def start(self):
         """Start monitoring"""
@@ -750,8 +878,9 @@ class SysMonitoringTraceDispatcher:
     def stop(self):
         """Stop monitoring"""
         self._unregister_tool()
+        self.active_frames.clear()
         self._logic.stop()
-        logging.info("⏹ DEBUG SESSION ENDED\n")
+        logger.info("⏹ DEBUG SESSION ENDED\n")
         print(color_wrap("\n⏹ 调试会话结束", TraceTypes.COLOR_RETURN))
 
 
@@ -764,12 +893,17 @@ class CallTreeHtmlRender:
         self._executed_lines = defaultdict(lambda: defaultdict(set))  # 使用集合避免重复记录
         self._frame_executed_lines = defaultdict(lambda: defaultdict(set))
         self._source_files = {}  # 存储源代码文件内容
-        self._stack_variables = {}
+        self._escape_cache = {}  # 循环中重复出现的消息只转义一次
+        self._stack_variables = defaultdict(list)  # key为行消息idx，value为该行的栈变量记录
         self._comments_data = defaultdict(lambda: defaultdict(list))
         self.current_message_id = 0
         self._size_limit = 100 * 1024 * 1024
         self._current_size = 0
         self._size_exceeded = False
+        # 已渲染的HTML片段暂存到临时文件，长时间跟踪时消息不必常驻内存
+        self._spill_file = None
+        self._rendered_count = 0
+        self._error_count = 0
         self._html_template = """<!DOCTYPE html>
 <html>
 <head>
@@ -874,11 +1008,16 @@ class CallTreeHtmlRender:
                 text.append(item)
         return " ".join(text)
 
-    def _message_to_html(self, message, msg_type, log_data):
-        """将消息转换为HTML片段"""
+    def _message_to_html(self, message, msg_type, log_data, out):
+        """将消息转换为HTML片段并直接写入输出缓冲区"""
         stripped_message = message.lstrip()
         indent = len(message) - len(stripped_message)
-        escaped_content = html.escape(stripped_message).replace(" ", "&nbsp;")
+        escaped_content = self._escape_cache.get(stripped_message)
+        if escaped_content is None:
+            escaped_content = html.escape(stripped_message).replace(" ", "&nbsp;")
+            if len(self._escape_cache) >= _ESCAPE_CACHE_SIZE:
+                self._escape_cache.clear()
+            self._escape_cache[stripped_message] = escaped_content
 
         data = log_data.get("data", {}) if isinstance(log_data, dict) else {}
         original_filename = data.get("original_filename")
@@ -886,54 +1025,48 @@ class CallTreeHtmlRender:
         frame_id = data.get("frame_id")
         comment_html = ""
         idx = log_data.get("idx", None)
-        if self._stack_variables.get(idx):
-            comment = self.format_stack_variables(self._stack_variables[idx])
+        stack_variables = self._stack_variables.get(idx)
+        if stack_variables:
+            comment = self.format_stack_variables(stack_variables)
             comment_id = f"comment_{idx}"
             comment_html = self._build_comment_html(comment_id, comment) if comment else ""
         view_source_html = self._build_view_source_html(original_filename, line_number, frame_id)
-        html_parts = []
         if msg_type == TraceTypes.CALL:
-            html_parts.extend(
-                [
-                    f'<div class="foldable {TraceTypes.HTML_CALL}" style="padding-left:{indent}px">',
-                    f"    {escaped_content}{view_source_html}{comment_html}",
-                    "</div>",
-                    '<div class="call-group">',
-                ]
+            html_parts = (
+                f'<div class="foldable {TraceTypes.HTML_CALL}" style="padding-left:{indent}px">\n',
+                f"    {escaped_content}{view_source_html}{comment_html}\n",
+                "</div>\n",
+                '<div class="call-group">\n',
             )
         elif msg_type == TraceTypes.RETURN:
-            html_parts.extend(
-                [
-                    "</div>",
-                    f'<div class="{TraceTypes.HTML_RETURN}" style="padding-left:{indent}px">',
-                    f"    {escaped_content}{comment_html}",
-                    "</div>",
-                ]
+            html_parts = (
+                "</div>\n",
+                f'<div class="{TraceTypes.HTML_RETURN}" style="padding-left:{indent}px">\n',
+                f"    {escaped_content}{comment_html}\n",
+                "</div>\n",
             )
         elif msg_type in (TraceTypes.EXCEPTION, TraceTypes.ERROR):
-            html_parts.extend(
-                [
-                    "</div>",
-                    f'<div class="{TraceTypes.HTML_ERROR}" style="padding-left:{indent}px">',
-                    f"    {escaped_content}{view_source_html}{comment_html}",
-                    "</div>",
-                ]
+            html_parts = (
+                "</div>\n",
+                f'<div class="{TraceTypes.HTML_ERROR}" style="padding-left:{indent}px">\n',
+                f"    {escaped_content}{view_source_html}{comment_html}\n",
+                "</div>\n",
             )
         else:
-            html_parts.extend(
-                [
-                    f'<div class="{msg_type}" style="padding-left:{indent}px">',
-                    f"    {escaped_content}{view_source_html}{comment_html}",
-                    "</div>",
-                ]
+            html_parts = (
+                f'<div class="{msg_type}" style="padding-left:{indent}px">\n',
+                f"    {escaped_content}{view_source_html}{comment_html}\n",
+                "</div>\n",
             )
-        html_content = "\n".join(html_parts) + "\n"
-        self._current_size += len(html_content)
+        self._current_size += sum(map(len, html_parts))
         if self._current_size > self._size_limit and not self._size_exceeded:
             self._size_exceeded = True
             size_limit_mb = self._size_limit / (1024 * 1024)
-            return f'<div class="{TraceTypes.HTML_ERROR}">⚠ HTML报告大小已超过{size_limit_mb}MB限制，后续内容将被忽略</div>\n'
-        return html_content
+            out.write(
+                f'<div class="{TraceTypes.HTML_ERROR}">⚠ HTML报告大小已超过{size_limit_mb}MB限制，后续内容将被忽略</div>\n'
+            )
+            return
+        out.writelines(html_parts)
 
     def _build_comment_html(self, comment_id, comment):
         """构建评论HTML片段"""
@@ -956,9 +1089,8 @@ class CallTreeHtmlRender:
         if filename in self._source_files:
             return
         try:
-            with open(filename, "rb") as f:
-                content = base64.b64encode(f.read()).decode("utf-8")
-                self._source_files[filename] = content
+            with open(filename, "r", encoding="utf-8", errors="replace") as f:
+                self._source_files[filename] = f.read()
         except (IOError, OSError) as e:
             self._source_files[filename] = f"// Error loading source file: {str(e)}"
 
@@ -971,8 +1103,6 @@ class CallTreeHtmlRender:
     def add_stack_variable_create(self, idx, opcode, var_name, value):
         if self._size_exceeded:
             return
-        if idx not in self._stack_variables:
-            self._stack_variables[idx] = []
         self._stack_variables[idx].append((opcode, var_name, value))
 
     def add_raw_message(self, log_data, color_type):
@@ -984,7 +1114,7 @@ class CallTreeHtmlRender:
             message = log_data
         else:
             # 预缓存格式化结果避免重复格式化
-            message = log_data["template"].format(**log_data["data"])
+            message = log_data["template"].format_map(log_data["data"])
 
         if color_type == TraceTypes.COLOR_LINE and isinstance(log_data, dict) and "lineno" in log_data.get("data", {}):
             data = log_data["data"]
@@ -995,18 +1125,56 @@ class CallTreeHtmlRender:
                 self._executed_lines[original_filename][frame_id].add(lineno)
                 self._load_source_file(original_filename)
         self._messages.append((message, color_type, log_data))
+        if len(self._messages) >= _HTML_SPILL_THRESHOLD:
+            self._spill_messages()
 
-    def generate_html(self):
-        """生成完整的HTML报告"""
-        buffer = []
-        error_count = 0
-        # 这块需要在js中进行，翻译成js代码， 使用到的self._messages,  self._stack_variables 直接传入js
-        for idx, (message, msg_type, log_data) in enumerate(self._messages):
+    def _render_messages(self, messages, out):
+        """渲染消息为HTML片段，渲染后释放对应行的栈变量记录"""
+        stack_variables = self._stack_variables
+        for message, msg_type, log_data in messages:
             if self._size_exceeded:
-                continue
-            buffer.append(self._message_to_html(message, msg_type, log_data))
+                break
+            self._message_to_html(message, msg_type, log_data, out)
+            # 超出大小限制的消息没有写入，不计入统计
+            if self._size_exceeded:
+                break
+            self._rendered_count += 1
             if msg_type in (TraceTypes.ERROR, TraceTypes.EXCEPTION):
-                error_count += 1
+                self._error_count += 1
+            if isinstance(log_data, dict) and "idx" in log_data:
+                stack_variables.pop(log_data["idx"], None)
+
+    def _spill_messages(self):
+        """
+        将已完整的消息渲染后写入临时文件
+
+        最新的行消息还可能被handle_opcode追加栈变量，它及其后的消息保留到下次再渲染
+        """
+        messages = self._messages
+        current_id = self.trace_logic._message_id
+        split = len(messages)
+        for i in range(len(messages) - 1, -1, -1):
+            log_data = messages[i][2]
+            idx = log_data.get("idx") if isinstance(log_data, dict) else None
+            if idx is None:
+                continue
+            if idx >= current_id:
+                split = i
+            break
+        if split:
+            self._render_to_spill_file(messages[:split])
+            del messages[:split]
+
+    def _render_to_spill_file(self, messages):
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self._render_messages(messages, self._spill_file)
+
+    def _write_html(self, out):
+        """将完整的HTML报告写入out，消息片段统一从临时文件拷贝"""
+        if self._messages:
+            self._render_to_spill_file(self._messages)
+            self._messages.clear()
 
         generation_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         executed_lines_data = {
@@ -1015,35 +1183,53 @@ class CallTreeHtmlRender:
         }
         executed_lines_json = json.dumps(executed_lines_data)
 
-        source_files_json = json.dumps(self._source_files)
+        # 源码以原文嵌入<script>，需转义"</"防止提前闭合标签
+        source_files_json = json.dumps(self._source_files).replace("</", "<\\/")
         comments_json = json.dumps(self._comments_data)
 
-        return self._html_template.format(
-            generation_time=generation_time,
-            message_count=len(self._messages),
-            error_count=error_count,
-            content="".join(buffer),
-            executed_lines_data=executed_lines_json,
-            source_files_data=source_files_json,
-            comments_data=comments_json,
+        head, tail = self._html_template.split("{content}", 1)
+        out.write(
+            head.format(
+                generation_time=generation_time,
+                message_count=self._rendered_count,
+                error_count=self._error_count,
+            )
+        )
+        if self._spill_file is not None:
+            self._spill_file.seek(0)
+            shutil.copyfileobj(self._spill_file, out)
+            self._spill_file.seek(0, io.SEEK_END)
+        out.write(
+            tail.format(
+                executed_lines_data=executed_lines_json,
+                source_files_data=source_files_json,
+                comments_data=comments_json,
+            )
         )
 
+    def generate_html(self):
+        """生成完整的HTML报告"""
+        out = io.StringIO()
+        self._write_html(out)
+        return out.getvalue()
+
     def save_to_file(self, filename):
         """将HTML报告保存到文件"""
         p = Path(filename)
         if p.is_absolute():
             # If it's an absolute path, ensure parent directories exist
             p.parent.mkdir(parents=True, exist_ok=True)
-            html_content = self.generate_html()
-            p.write_text(html_content, encoding="utf-8")
             log_path = str(p)
         else:
-            html_content = self.generate_html()
             log_dir = os.path.join(os.path.dirname(__file__), "logs")
             os.makedirs(log_dir, exist_ok=True)
             log_path = os.path.join(log_dir, filename)
-            with open(log_path, "w", encoding="utf-8") as f:
-                f.write(html_content)
+        with open(log_path, "w", encoding="utf-8") as f:
+            self._write_html(f)
+        # 报告已落盘，释放临时文件
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
         print(f"正在生成HTML报告 {log_path} ...")
 
 
@@ -1188,20 +1374,53 @@ class TraceLogExtractor:
         return logs, references_group
 
 
+def _is_suspended_at_yield(frame):
+    """帧的最后一条指令是yield时，return事件只表示暂停而不是真正返回"""
+    lasti = frame.f_lasti
+    return lasti >= 0 and frame.f_code.co_code[lasti] in _YIELD_OPCODES
+
+
+def _indent(depth):
+    """按调用深度获取缩进字符串，常见深度直接查表避免重复拼接"""
+    if 0 <= depth < _INDENT_CACHE_SIZE:
+        return _INDENT_CACHE[depth]
+    return _INDENT * depth
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_filename(filename):
+    """格式化文件名用于日志显示，__init__.py保留所在包名"""
+    try:
+        path = Path(filename)
+        if path.name == "__init__.py":
+            parts = list(path.parts)
+            if len(parts) > 1:
+                return str(Path(*parts[-2:]))
+        return path.name
+    except (TypeError, ValueError) as e:
+        logger.warning("文件名格式化失败: %s", str(e))
+        return filename
+
+
 class TraceLogic:
     class _FileCache:
         def __init__(self):
-            self._file_name_cache = {}
-            self._trace_expressions = defaultdict(dict)
+            # (filename, lineno) -> (表达式, 编译结果)，无追踪注释的行缓存为None
+            self._trace_expressions = {}
             self._ast_cache = {}
             self._var_ops_cache = {}
+            # filename -> 去掉换行符的源码行元组，避免每个行事件都走linecache.checkcache
+            self._source_lines = {}
+            # filename -> 文件中是否存在追踪注释，没有则跳过逐行的表达式处理
+            self._has_trace_comments = {}
 
     class _FrameData:
         def __init__(self):
             self._frame_id_map = {}
-            self._frame_locals_map = {}
-            self._current_frame_id = 0
+            self._frame_id_counter = itertools.count(1)
             self._code_var_ops = {}
+            # 生成器帧 -> 抛出异常时的f_lasti，close()或异常退出时return事件同样停在yield处
+            self._raised_at = {}
 
     class _OutputHandlers:
         def __init__(self, parent: "TraceLogic"):
@@ -1211,17 +1430,18 @@ class TraceLogic:
                 "html": parent._html_output,
             }
             self._active_outputs = set(["html", "file"])
+            # 日志文件当前的字节偏移，enable_output打开文件时重置
+            self._log_file_position = 0
 
     def __init__(self, config: TraceConfig):
         """初始化实例属性"""
         self.stack_depth = 0
         self.config = config
-        self._log_queue = queue.Queue()
+        self._log_queue = deque()
         self._flush_event = threading.Event()
         self._timer_thread = None
         self._running_flag = False
         self._html_render = CallTreeHtmlRender(self)
-        self._stack_variables = {}
         self._message_id = 0
         self.exception_chain = []
         # 分组属性
@@ -1229,6 +1449,10 @@ class TraceLogic:
         self._frame_data = self._FrameData()
         self._output = self._OutputHandlers(self)
         self.last_line_vars = None
+        self._last_filename = None
+        self._last_formatted_filename = None
+        self._last_source_filename = None
+        self._last_source_lines = ()
 
         self.enable_output("file", filename=str(Path(_LOG_DIR) / Path(self.config.report_name).stem) + ".log")
         if self.config.disable_html:
@@ -1237,20 +1461,27 @@ class TraceLogic:
     def _get_frame_id(self, frame):
         """获取当前帧ID"""
         frame_key = id(frame)
-        if frame_key not in self._frame_data._frame_id_map:
-            self._frame_data._current_frame_id += 1
-            self._frame_data._frame_id_map[frame_key] = self._frame_data._current_frame_id
-        return self._frame_data._frame_id_map[frame_key]
+        frame_id_map = self._frame_data._frame_id_map
+        frame_id = frame_id_map.get(frame_key)
+        if frame_id is None:
+            frame_id = frame_id_map[frame_key] = next(self._frame_data._frame_id_counter)
+        return frame_id
 
     def enable_output(self, output_type: str, **kwargs):
         """启用特定类型的输出"""
         if output_type == "file" and "filename" in kwargs:
             try:
                 # 使用with语句确保文件正确关闭
-                self._output._log_file = open(kwargs["filename"], "w+", encoding="utf-8")
-                self._output._log_file_index = open(str(kwargs["filename"]) + ".index", "w+", encoding="utf-8")
+                # 大缓冲区批量落盘；newline固定为\n使自行统计的字节偏移与文件一致
+                self._output._log_file = open(
+                    kwargs["filename"], "w+", encoding="utf-8", newline="\n", buffering=_LOG_BUFFER_SIZE
+                )
+                self._output._log_file_index = open(
+                    str(kwargs["filename"]) + ".index", "w+", encoding="utf-8", newline="\n", buffering=_LOG_BUFFER_SIZE
+                )
+                self._output._log_file_position = 0
             except (IOError, OSError, PermissionError) as e:
-                logging.error("无法打开日志文件: %s", str(e))
+                logger.error("无法打开日志文件: %s", str(e))
                 raise
         self._output._active_outputs.add(output_type)
 
@@ -1261,7 +1492,7 @@ class TraceLogic:
                 self._output._log_file.close()
                 self._output._log_file_index.close()
             except (IOError, OSError) as e:
-                logging.error("关闭日志文件时出错: %s", str(e))
+                logger.error("关闭日志文件时出错: %s", str(e))
             finally:
                 self._output._log_file = None
         self._output._active_outputs.discard(output_type)
@@ -1289,11 +1520,13 @@ class TraceLogic:
     def _file_output(self, log_data, log_type):
         """文件输出处理"""
         if self._output._log_file:
-            msg = self._format_log_message(log_data)
-            position = self._output._log_file.tell()
+            line = self._format_log_message(log_data) + "\n"
+            # 文本文件的tell()会强制flush，这里自行累计字节偏移
+            position = self._output._log_file_position
             if log_type == TraceTypes.CALL:
                 self.write_log_index(log_type, log_data, position)
-            self._output._log_file.write(msg + "\n")
+            self._output._log_file.write(line)
+            self._output._log_file_position = position + len(line.encode("utf-8"))
             if log_type in (TraceTypes.RETURN, TraceTypes.EXCEPTION):
                 self.write_log_index(log_type, log_data, position)
 
@@ -1305,50 +1538,75 @@ class TraceLogic:
         """格式化日志消息"""
         if isinstance(log_data, str):
             return log_data
-        return log_data["template"].format(**log_data["data"])
+        return log_data["template"].format_map(log_data["data"])
 
     def _add_to_buffer(self, log_data, color_type):
-        """将日志数据添加到队列并立即处理"""
-
-        self._log_queue.put((log_data, color_type))
+        """将日志数据添加到队列，积累满一批后唤醒刷新线程"""
+        log_queue = self._log_queue
+        log_queue.append((log_data, color_type))
+        if len(log_queue) >= _FLUSH_BATCH_SIZE:
+            self._flush_event.set()
 
     def _flush_buffer(self):
         """刷新队列，输出所有日志"""
-        while not self._log_queue.empty():
+        log_queue = self._log_queue
+        while log_queue:
             try:
-                log_data, color_type = self._log_queue.get_nowait()
-                for output_type in self._output._active_outputs:
-                    if output_type in self._output._output_handlers:
-                        self._output._output_handlers[output_type](log_data, color_type)
-            except queue.Empty:
+                log_data, color_type = log_queue.popleft()
+            except IndexError:
                 break
+            for output_type in self._output._active_outputs:
+                if output_type in self._output._output_handlers:
+                    self._output._output_handlers[output_type](log_data, color_type)
+        if getattr(self._output, "_log_file", None):
+            self._output._log_file.flush()
+            self._output._log_file_index.flush()
 
     def _flush_scheduler(self):
-        """定时刷新调度器"""
+        """定时刷新调度器，按批次或超时批量落盘"""
         while self._running_flag:
-            time.sleep(1)
+            self._flush_event.wait(_FLUSH_INTERVAL)
+            self._flush_event.clear()
             self._flush_buffer()
 
     def _get_formatted_filename(self, filename):
-        """获取格式化后的文件名"""
-        if filename in self._file_cache._file_name_cache:
-            return self._file_cache._file_name_cache[filename]
-
+        """获取格式化后的文件名，连续事件多在同一文件内，先按身份比较上一次的结果"""
+        if filename is self._last_filename:
+            return self._last_formatted_filename
+        formatted = _format_filename(filename)
+        self._last_filename = filename
+        self._last_formatted_filename = formatted
+        return formatted
+
+    def _get_file_lines(self, filename):
+        """获取文件去掉换行符的源码行元组，连续事件多在同一文件内，先按身份比较上一次的文件"""
+        if filename is self._last_source_filename:
+            return self._last_source_lines
+        source_lines = self._file_cache._source_lines
+        lines = source_lines.get(filename)
+        if lines is None:
+            lines = source_lines[filename] = tuple(line.rstrip("\n") for line in linecache.getlines(filename))
+        self._last_source_filename = filename
+        self._last_source_lines = lines
+        return lines
+
+    def _get_source_line(self, filename, lineno):
+        """获取源码行"""
+        lines = self._get_file_lines(filename)
+        if 0 < lineno <= len(lines):
+            return lines[lineno - 1]
+        return ""
+
+    def _file_has_trace_comments(self, filename):
+        """文件中是否包含追踪注释，每个文件只扫描一次"""
+        has_trace_comments = self._file_cache._has_trace_comments
         try:
-            path = Path(filename)
-            if path.name == "__init__.py":
-                parts = list(path.parts)
-                if len(parts) > 1:
-                    formatted = str(Path(*parts[-2:]))
-                else:
-                    formatted = path.name
-            else:
-                formatted = path.name
-            self._file_cache._file_name_cache[filename] = formatted
-            return formatted
-        except (TypeError, ValueError) as e:
-            logging.warning("文件名格式化失败: %s", str(e))
-            return filename
+            return has_trace_comments[filename]
+        except KeyError:
+            pass
+        lines = self._get_file_lines(filename)
+        result = has_trace_comments[filename] = any("#" in line and self._parse_trace_comment(line) for line in lines)
+        return result
 
     def _parse_trace_comment(self, line):
         """解析追踪注释"""
@@ -1362,17 +1620,24 @@ class TraceLogic:
 
         return comment[6:].strip()
 
-    def _get_trace_expression(self, filename, lineno):
-        """获取缓存的追踪表达式"""
-        if filename not in self._file_cache._trace_expressions:
-            return None
-        return self._file_cache._trace_expressions[filename].get(lineno)
-
-    def _cache_trace_expression(self, filename, lineno, expr):
-        """缓存追踪表达式"""
-        if filename not in self._file_cache._trace_expressions:
-            self._file_cache._trace_expressions[filename] = {}
-        self._file_cache._trace_expressions[filename][lineno] = expr
+    def _get_trace_expression(self, filename, lineno, line):
+        """按位置获取追踪表达式及其编译结果，首次访问时解析注释并编译"""
+        key = (filename, lineno)
+        trace_expressions = self._file_cache._trace_expressions
+        try:
+            return trace_expressions[key]
+        except KeyError:
+            pass
+        expr = self._parse_trace_comment(line)
+        entry = None
+        if expr:
+            try:
+                _, compiled = self._compile_expr(expr)
+            except SyntaxError:
+                compiled = None
+            entry = (expr, compiled)
+        trace_expressions[key] = entry
+        return entry
 
     def _compile_expr(self, expr):
         """编译表达式并缓存结果"""
@@ -1386,15 +1651,20 @@ class TraceLogic:
     def handle_call(self, frame):
         """增强参数捕获逻辑"""
         if self.stack_depth >= _MAX_CALL_DEPTH:
-            logging.warning("超过最大调用深度已达到，无法记录更多调用 %s", str(frame))
+            logger.warning("超过最大调用深度已达到，无法记录更多调用 %s", frame)
             return
         try:
             args_info = []
             if frame.f_code.co_name == "<module>":
                 log_prefix = TraceTypes.PREFIX_MODULE
             else:
-                args, _, _, values = inspect.getargvalues(frame)
-                args_info = [f"{arg}={truncate_repr_value(values[arg])}" for arg in args]
+                # 直接从code对象取参数名，避免inspect.getargvalues的额外开销
+                code = frame.f_code
+                arg_count = code.co_argcount + code.co_kwonlyargcount
+                values = frame.f_locals
+                args_info = [
+                    f"{arg}={truncate_repr_value(values[arg])}" for arg in code.co_varnames[:arg_count] if arg in values
+                ]
                 log_prefix = TraceTypes.PREFIX_CALL
             parent_frame = frame.f_back
             if parent_frame is not None:
@@ -1403,12 +1673,11 @@ class TraceLogic:
                 parent_frame_id = 0
             filename = self._get_formatted_filename(frame.f_code.co_filename)
             frame_id = self._get_frame_id(frame)
-            self._frame_data._frame_locals_map[frame_id] = frame.f_locals
             self._add_to_buffer(
                 {
-                    "template": "{indent}↘ {prefix} {filename}:{lineno} {func}({args}) [frame:{frame_id}]",
+                    "template": _CALL_TEMPLATE,
                     "data": {
-                        "indent": _INDENT * self.stack_depth,
+                        "indent": _indent(self.stack_depth),
                         "prefix": log_prefix,
                         "filename": filename,
                         "original_filename": frame.f_code.co_filename,
@@ -1424,7 +1693,7 @@ class TraceLogic:
             self.stack_depth += 1
         except (AttributeError, TypeError) as e:
             traceback.print_exc()
-            logging.error("Call logging error: %s", str(e))
+            logger.error("Call logging error: %s", str(e))
             self._add_to_buffer(
                 {"template": "⚠ 记录调用时出错: {error}", "data": {"error": str(e)}},
                 TraceTypes.ERROR,
@@ -1435,14 +1704,22 @@ class TraceLogic:
 
         return_str = truncate_repr_value(return_value)
         filename = self._get_formatted_filename(frame.f_code.co_filename)
-        frame_id = self._get_frame_id(frame)
-        if frame_id in self._frame_data._frame_locals_map:
-            del self._frame_data._frame_locals_map[frame_id]
+        # 帧返回后其id()可能被新帧复用，返回时清理帧ID映射；
+        # 生成器只是在yield处暂停时保留，恢复执行后沿用同一个帧ID
+        # 生成器被close()/回收或因异常退出时，return事件停在抛出异常的那条yield指令上，此时需释放帧ID
+        frame_data = self._frame_data
+        raised_at = frame_data._raised_at.pop(id(frame), None)
+        if frame.f_code.co_flags & _GENERATOR_FLAGS and raised_at != frame.f_lasti and _is_suspended_at_yield(frame):
+            frame_id = self._get_frame_id(frame)
+        else:
+            frame_id = frame_data._frame_id_map.pop(id(frame), None)
+        if frame_id is None:
+            frame_id = next(frame_data._frame_id_counter)
         self._add_to_buffer(
             {
-                "template": "{indent}↗ RETURN {filename} {func}() → {return_value} [frame:{frame_id}]",
+                "template": _RETURN_TEMPLATE,
                 "data": {
-                    "indent": _INDENT * (self.stack_depth - 1),
+                    "indent": _indent(self.stack_depth - 1),
                     "filename": filename,
                     "lineno": frame.f_lineno,
                     "return_value": return_str,
@@ -1507,7 +1784,9 @@ class TraceLogic:
                 value = globals_dict[var]
             else:
                 try:
-                    value = self.cache_eval(frame, var)  # nosec
+                    # 复用已取得的locals，避免再次访问frame.f_locals触发快速局部变量同步
+                    _, compiled = self._compile_expr(var)
+                    value = eval(compiled, globals_dict, locals_dict)  # nosec
                 except (AttributeError, NameError, SyntaxError):
                     continue
             tracked_vars[var] = truncate_repr_value(value)
@@ -1518,7 +1797,7 @@ class TraceLogic:
         """基础行号跟踪"""
         lineno = frame.f_lineno
         filename = frame.f_code.co_filename
-        line = linecache.getline(filename, lineno).strip("\n")
+        line = self._get_source_line(filename, lineno)
         formatted_filename = self._get_formatted_filename(filename)
         frame_id = self._get_frame_id(frame)
         self._message_id += 1
@@ -1534,9 +1813,9 @@ class TraceLogic:
 
         log_data = {
             "idx": self._message_id,
-            "template": "{indent}▷ {filename}:{lineno} {line}",
+            "template": _LINE_TEMPLATE,
             "data": {
-                "indent": _INDENT * self.stack_depth,
+                "indent": _indent(self.stack_depth),
                 "filename": formatted_filename,
                 "lineno": lineno,
                 "line": line,
@@ -1552,7 +1831,8 @@ class TraceLogic:
 
         self._add_to_buffer(log_data, TraceTypes.COLOR_LINE)
 
-        self._process_trace_expression(frame, line, filename, lineno)
+        if self._file_has_trace_comments(filename):
+            self._process_trace_expression(frame, line, filename, lineno)
         if self.config.capture_vars:
             self._process_captured_vars(frame)
 
@@ -1563,22 +1843,22 @@ class TraceLogic:
 
     def _process_trace_expression(self, frame, line, filename, lineno):
         """处理追踪表达式"""
-        cached_expr = self._get_trace_expression(filename, lineno)
-        if not cached_expr:
-            cached_expr = self._parse_trace_comment(line)
-            self._file_cache._trace_expressions[filename][lineno] = cached_expr
-        if not cached_expr:
+        entry = self._get_trace_expression(filename, lineno, line)
+        if entry is None:
             return
+        cached_expr, compiled = entry
         try:
-            value = self.cache_eval(frame, cached_expr)  # 预编译表达式
+            if compiled is None:
+                _, compiled = self._compile_expr(cached_expr)
+            value = eval(compiled, frame.f_globals, frame.f_locals)  # nosec
         except (AttributeError, NameError, SyntaxError) as e:
             value = f"<Failed to evaluate: {str(e)}>"
         formatted = truncate_repr_value(value)
         self._add_to_buffer(
             {
-                "template": "{indent}↳ Debug Statement {expr}={value} [frame:{frame_id}]",
+                "template": _TRACE_EXPR_TEMPLATE,
                 "data": {
-                    "indent": _INDENT * (self.stack_depth),
+                    "indent": _indent(self.stack_depth),
                     "expr": cached_expr,
                     "value": formatted,
                     "frame_id": self._get_frame_id(frame),
@@ -1593,9 +1873,9 @@ class TraceLogic:
         if captured_vars:
             self._add_to_buffer(
                 {
-                    "template": "{indent}↳ 变量: {vars} [frame:{frame_id}]",
+                    "template": _CAPTURED_VARS_TEMPLATE,
                     "data": {
-                        "indent": _INDENT * (self.stack_depth + 1),
+                        "indent": _indent(self.stack_depth + 1),
                         "vars": ", ".join(f"{k}={v}" for k, v in captured_vars.items()),
                         "frame_id": self._get_frame_id(frame),
                     },
@@ -1605,19 +1885,27 @@ class TraceLogic:
 
     def flush_exception(self):
         for i in self.exception_chain:
-            self._log_queue.put(i)
+            self._log_queue.append(i)
         self.exception_chain = []
 
+    def release_frame(self, frame):
+        """帧因异常展开而退出时释放其帧ID，避免被复用同一id()的新帧沿用"""
+        frame_key = id(frame)
+        self._frame_data._frame_id_map.pop(frame_key, None)
+        self._frame_data._raised_at.pop(frame_key, None)
+
     def handle_exception(self, exc_type, exc_value, frame):
         """记录异常信息"""
         filename = self._get_formatted_filename(frame.f_code.co_filename)
         lineno = frame.f_lineno
         frame_id = self._get_frame_id(frame)
+        if frame.f_code.co_flags & _GENERATOR_FLAGS:
+            self._frame_data._raised_at[id(frame)] = frame.f_lasti
         msg = (
             {
-                "template": "{indent}⚠ EXCEPTION IN {func} AT {filename}:{lineno} {exc_type}: {exc_value} [frame:{frame_id}]",
+                "template": _EXCEPTION_TEMPLATE,
                 "data": {
-                    "indent": _INDENT * (self.stack_depth - 1),
+                    "indent": _indent(self.stack_depth - 1),
                     "filename": filename,
                     "lineno": lineno,
                     "exc_type": exc_type.__name__,
@@ -1642,9 +1930,10 @@ class TraceLogic:
             globals_dict = frame.f_globals
             results = {}
 
-            for expr in self.config.capture_vars:
+            for expr, compiled in self.config._compiled_capture:
                 try:
-                    _, compiled = self._compile_expr(expr)
+                    if compiled is None:
+                        _, compiled = self._compile_expr(expr)
                     # 安全警告：eval使用是必要的调试功能
                     value = eval(compiled, globals_dict, locals_dict)  # nosec
                     formatted = truncate_repr_value(value)
@@ -1663,14 +1952,21 @@ class TraceLogic:
                 try:
                     self.config.callback(results)
                 except (AttributeError, TypeError) as e:
-                    logging.error("回调函数执行失败: %s", str(e))
+                    logger.error("回调函数执行失败: %s", str(e))
 
             return results
         except (AttributeError, TypeError) as e:
-            logging.error("变量捕获失败: %s", str(e))
+            logger.error("变量捕获失败: %s", str(e))
             return {}
 
+    def is_flush_thread(self):
+        """当前线程是否为后台刷新线程"""
+        timer_thread = self._timer_thread
+        return timer_thread is not None and timer_thread.ident == threading.get_ident()
+
     def start_flush_thread(self):
+        # 线程启动前置位运行标志，否则调度循环会立即退出
+        self._running_flag = True
         self._timer_thread = threading.Thread(target=self._flush_scheduler)
         self._timer_thread.daemon = True
         self._timer_thread.start()
@@ -1682,40 +1978,51 @@ class TraceLogic:
     def stop(self):
         """停止逻辑处理"""
         self._running_flag = False
+        self._flush_event.set()
         if self._timer_thread:
-            self._timer_thread.join(timeout=1)
+            # 必须等刷新线程退出：它可能还在写日志文件和HTML溢出文件，超时后并发写入会损坏输出
+            self._timer_thread.join()
+            self._timer_thread = None
         if self.exception_chain:
             for i in self.exception_chain:
-                self._log_queue.put(i)
+                self._log_queue.append(i)
             self.exception_chain = []
         self._flush_buffer()
-        while not self._log_queue.empty():
-            self._log_queue.get_nowait()
+        self._log_queue.clear()
         self.disable_output("file")
         if "html" in self._output._active_outputs:
             self._html_render.save_to_file(self.config.report_name)
 
 
 def get_tracer(module_path, config: TraceConfig):
-    # tracer_core_name = "tracer_core.pyd" if os.name == "nt" else "tracer_core.so"
-    # tracer_core_path = os.path.join(os.path.dirname(__file__), tracer_core_name)
-    # if os.path.exists(tracer_core_path):
-    #     try:
-    #         spec = importlib.util.spec_from_file_location("tracer_core", tracer_core_path)
-    #         tracer_core = importlib.util.module_from_spec(spec)
-    #         spec.loader.exec_module(tracer_core)
-    #         trace_dispatcher = tracer_core.TraceDispatcher
-    #         return trace_dispatcher(str(module_path), TraceLogic(config), config)
-    #     except Exception as e:
-    #         logging.error("💥 DEBUGGER IMPORT ERROR: %s\n%s", str(e), traceback.format_exc())
-    #         print(
-    #             color_wrap(
-    #                 f"❌ 调试器导入错误: {str(e)}\n{traceback.format_exc()}",
-    #                 TraceTypes.COLOR_ERROR,
-    #             )
-    #         )
-    #         raise
-    return None
+    """
+    加载C++实现的tracer_core扩展，在native层过滤非目标文件的事件
+
+    扩展依赖Python 3.11的内部帧结构，其他版本、未编译或加载失败时返回None，
+    由调用方回退到纯Python实现；扩展基于settrace，只跟踪调用时同样回退
+    """
+    if sys.version_info[:2] != (3, 11) or config.disable_line_trace:
+        return None
+    tracer_core_path = os.path.join(os.path.dirname(__file__), _TRACER_CORE_NAME)
+    if not os.path.exists(tracer_core_path):
+        return None
+    logic = None
+    try:
+        spec = importlib.util.spec_from_file_location("tracer_core", tracer_core_path)
+        tracer_core = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(tracer_core)
+        logic = TraceLogic(config)
+        dispatcher = tracer_core.TraceDispatcher(str(module_path), logic, config)
+        # 扩展构造成功后再启动刷新线程，失败时不会留下孤立线程
+        logic.start_flush_thread()
+        return dispatcher
+    except Exception as e:
+        # 关闭已打开的日志文件，回退的Python实现会以同一报告名重新打开
+        if logic is not None:
+            logic.disable_output("file")
+        logger.error("💥 DEBUGGER IMPORT ERROR: %s\n%s", str(e), traceback.format_exc())
+        print(color_wrap(f"❌ 调试器扩展加载失败，使用Python实现: {str(e)}", TraceTypes.COLOR_ERROR))
+        return None
 
 
 def start_line_trace(exclude: List[str] = None):
@@ -1749,7 +2056,7 @@ def start_trace(module_path=None, config: TraceConfig = None, **kwargs):
     tracer = None
     tracer = get_tracer(module_path, config)
     if not tracer:
-        if sys.version_info >= (3, 11):
+        if sys.version_info >= (3, 12):
             tracer = SysMonitoringTraceDispatcher(str(module_path), config)
         else:
             tracer = TraceDispatcher(str(module_path), config)
@@ -1762,7 +2069,7 @@ def start_trace(module_path=None, config: TraceConfig = None, **kwargs):
         caller_frame.f_trace_opcodes = True
         return tracer
     except Exception as e:
-        logging.error("💥 DEBUGGER INIT ERROR: %s\n%s", str(e), traceback.format_exc())
+        logger.error("💥 DEBUGGER INIT ERROR: %s\n%s", str(e), traceback.format_exc())
         print(
             color_wrap(
                 f"❌ 调试器初始化错误: {str(e)}\n{traceback.format_exc()}",
@@ -1795,6 +2102,7 @@ def trace(
     ignore_system_paths: bool = True,
     start_function: Tuple[str, int] = None,
     disable_html: bool = False,
+    disable_line_trace: bool = False,
 ):
     """函数跟踪装饰器
 
@@ -1810,6 +2118,7 @@ def trace(
         ignore_system_paths: 是否忽略系统路径和第三方包路径
         start_function: 起始函数名和行号
         disable_html: 是否禁用HTML报告
+        disable_line_trace: 是否只记录调用/返回，不跟踪行事件
     """
     if not target_files:
         target_files = [sys._getframe().f_back.f_code.co_filename]
@@ -1830,6 +2139,7 @@ def trace(
                 ignore_system_paths=ignore_system_paths,
                 start_function=start_function,
                 disable_html=disable_html,
+                disable_line_trace=disable_line_trace,
             )
             t = start_trace(config=config)
             try:
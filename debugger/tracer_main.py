@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-import logging
 import os
 import sys
 import traceback
@@ -10,7 +9,7 @@ from types import ModuleType
 from typing import Any, Dict, List, Optional
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from debugger.tracer import TraceConfig, color_wrap, start_trace
+from debugger.tracer import TraceConfig, color_wrap, logger, start_trace
 
 
 def execute_script(target: Path, args: List[str]) -> None:
@@ -88,6 +87,11 @@ def parse_args(argv: List[str]) -> Dict[str, Any]:
         action="store_true",
         help="禁用HTML报告生成",
     )
+    parser.add_argument(
+        "--disable-line-trace",
+        action="store_true",
+        help="只跟踪函数调用和返回，不记录逐行执行",
+    )
     parser.add_argument(
         "--report-name",
         type=str,
@@ -147,6 +151,7 @@ def parse_args(argv: List[str]) -> Dict[str, Any]:
         "line_ranges": line_ranges,
         "enable_var_trace": args.enable_var_trace,
         "disable_html": args.disable_html,
+        "disable_line_trace": args.disable_line_trace,
         "report_name": args.report_name,
         "ignore_system_paths": not args.include_system,
         "start_function": start_function,
@@ -190,6 +195,7 @@ def debug_main(argv: Optional[List[str]] = None) -> int:
                     "  --line-ranges=FILE:START-END 要跟踪的行号范围(可逗号分隔多个)\n"
                     "  --enable-var-trace      启用变量操作跟踪\n"
                     "  --disable-html         禁用HTML报告生成\n"
+                    "  --disable-line-trace   只跟踪函数调用和返回，不记录逐行执行\n"
                     "  --report-name=NAME     自定义报告文件名(不含扩展名)\n"
                     "  --include-system       包含系统路径和第三方库的跟踪\n"
                     "  --start-function=FILE:LINE 指定开始跟踪的函数\n"
@@ -255,6 +261,7 @@ def debug_main(argv: Optional[List[str]] = None) -> int:
                 exclude_functions=args["exclude_functions"],
                 enable_var_trace=args["enable_var_trace"],
                 disable_html=args["disable_html"],
+                disable_line_trace=args["disable_line_trace"],
                 report_name=args.get("report_name", "trace_report.html"),
                 ignore_system_paths=args["ignore_system_paths"],
                 start_function=args["start_function"],
@@ -266,7 +273,7 @@ def debug_main(argv: Optional[List[str]] = None) -> int:
             exit_code = 130
         except (SystemExit, RuntimeError) as e:
             print(color_wrap(f"❌ 执行错误: {str(e)}", "error"))
-            logging.error("执行错误: %s\n%s", str(e), traceback.format_exc())
+            logger.error("执行错误: %s\n%s", str(e), traceback.format_exc())
             exit_code = 3
         finally:
             if tracer:
@@ -278,7 +285,7 @@ def debug_main(argv: Optional[List[str]] = None) -> int:
 
         return exit_code
     except (SystemExit, RuntimeError) as e:
-        logging.error("调试器崩溃: %s\n%s", str(e), traceback.format_exc())
+        logger.error("调试器崩溃: %s\n%s", str(e), traceback.format_exc())
         print(color_wrap(f"💥 调试器内部错误: {str(e)}", "error"))
         return 4
 
@@ -313,17 +313,9 @@ const TraceViewer = {
                 dialog.style.display = 'block';
                 return;
             }
-            // Get source code, decode if it's Base64-encoded
-            let text = window.sourceFiles[filename];
-        
-            // Attempt to decode Base64 with UTF-8 support
-            const raw = atob(text);
-            const bytes = new Uint8Array(raw.length);
-            for (let i = 0; i < raw.length; i++) {
-                bytes[i] = raw.charCodeAt(i);
-            }
-            text = new TextDecoder('utf-8').decode(bytes);
-            
+            // Source code is embedded as plain text
+            const text = window.sourceFiles[filename];
+
             const lines = text.split('\n');
             const frameLines = frameId ? this.getFrameLines(filename, frameId) : null;
 
@@ -7,16 +7,21 @@ LLM 查询工具模块
 """
 
 import argparse
+import atexit
 import datetime
 import difflib
 import fnmatch
+import functools
 import glob
+import itertools
 import json
 import logging
 import marshal
+import mmap
 import os
 import pprint
 import re
+import shutil
 import subprocess
 import sys
 import tempfile
@@ -26,6 +31,7 @@ import trace
 import traceback
 import zlib
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Callable, Dict, List, Optional, Tuple, Union
@@ -40,6 +46,11 @@ from pygments import highlight
 from pygments.formatters.terminal import TerminalFormatter
 from pygments.lexers.diff import DiffLexer
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from debugger.tracer import trace
 from tree import (
     BINARY_MAGIC_NUMBERS,
@@ -50,6 +61,8 @@ from tree import (
     FileSearchResult,
     FileSearchResults,
     MatchResult,
+    ParserLoader,
+    ParserUtil,
     RipgrepSearcher,
     SyntaxHighlight,
     find_diff,
@@ -57,7 +70,9 @@ from tree import (
 )
 
 just_fix_windows_console()
-sys.path.insert(0, os.path.dirname(__file__))
+# 模块所在目录只计算一次，其余路径都由它派生
+_MODULE_DIR = Path(__file__).parent
+sys.path.insert(0, str(_MODULE_DIR))
 
 
 class ModelConfig:
@@ -203,8 +218,8 @@ class ModelConfig:
 
 GLOBAL_MODEL_CONFIG = None
 MAX_FILE_SIZE = 32000
-LAST_QUERY_FILE = os.path.join(os.path.dirname(__file__), ".lastquery")
-PROMPT_DIR = os.path.join(os.path.dirname(__file__), "prompts")
+LAST_QUERY_FILE = os.path.join(_MODULE_DIR, ".lastquery")
+PROMPT_DIR = os.path.join(_MODULE_DIR, "prompts")
 
 
 @dataclass
@@ -262,13 +277,13 @@ def parse_arguments():
     parser.add_argument("--workflow", action="store_true", help="进入工作流执行模式")
     parser.add_argument(
         "--config",
-        default=os.path.join(os.path.dirname(__file__), ".llm_project.yml"),
+        default=os.path.join(_MODULE_DIR, ".llm_project.yml"),
         type=Path,
         help="项目配置文件路径（YAML格式）",
     )
     parser.add_argument(
         "--obsidian-doc",
-        default=os.environ.get("GPT_DOC", os.path.join(os.path.dirname(__file__), "obsidian")),
+        default=os.environ.get("GPT_DOC", os.path.join(_MODULE_DIR, "obsidian")),
         help="Obsidian文档备份目录路径",
     )
     parser.add_argument("--trace", action="store_true", help="启用详细的执行跟踪")
@@ -300,88 +315,161 @@ def sanitize_proxy_url(url):
         return url
 
 
+# 代理变量检测顺序：先处理all_proxy，具体协议只在尚未设置时补充
+_PROXY_VARS = (
+    ("all", ("all_proxy", "ALL_PROXY")),
+    ("https", ("https_proxy", "HTTPS_PROXY")),
+    ("http", ("http_proxy", "HTTP_PROXY")),
+)
+
+
 def detect_proxies():
     """检测并构造代理配置"""
     proxies = {}
     sources = {}
-    proxy_vars = [
-        ("http", ["http_proxy", "HTTP_PROXY"]),
-        ("https", ["https_proxy", "HTTPS_PROXY"]),
-        ("all", ["all_proxy", "ALL_PROXY"]),
-    ]
-
-    # 修改代理检测顺序，先处理具体协议再处理all_proxy
-    for protocol, proxy_vars in reversed(proxy_vars):
+    environ = os.environ
+    for protocol, proxy_vars in _PROXY_VARS:
         for var in proxy_vars:
-            if var in os.environ and os.environ[var]:
-                url = os.environ[var]
-                if protocol == "all":
-                    if not proxies.get("http"):
-                        proxies["http"] = url
-                        sources["http"] = var
-                    if not proxies.get("https"):
-                        proxies["https"] = url
-                        sources["https"] = var
-                else:
-                    if protocol not in proxies:
-                        proxies[protocol] = url
-                        sources[protocol] = var
-                break
+            url = environ.get(var)
+            if not url:
+                continue
+            if protocol == "all":
+                if not proxies.get("http"):
+                    proxies["http"] = url
+                    sources["http"] = var
+                if not proxies.get("https"):
+                    proxies["https"] = url
+                    sources["https"] = var
+            elif protocol not in proxies:
+                proxies[protocol] = url
+                sources[protocol] = var
+            break
     return proxies, sources
 
 
 def split_code(content, chunk_size):
-    """将代码内容分割成指定大小的块
-    注意：当前实现适用于英文字符场景，如需支持多语言建议改用更好的分块算法
+    """将代码内容按字符数惰性分割成指定大小的块
+    以生成器逐块产出，只有被消费的块才会复制，按字符切分不会截断多字节字符
     """
-    return [content[i : i + chunk_size] for i in range(0, len(content), chunk_size)]
+    for i in range(0, len(content), chunk_size):
+        yield content[i : i + chunk_size]
+
 
+_CONV_DIR = _MODULE_DIR / "conversation"
+INDEX_PATH = _CONV_DIR / "index.json"
+# 新建对话只追加到日志，读取时与index.json合并，日志过长时压缩回index.json
+INDEX_LOG_PATH = INDEX_PATH.with_name("index.log")
+_INDEX_LOG_COMPACT_THRESHOLD = 256
+# 已解析的索引，按两个索引文件的修改时间和大小判断是否需要重新读取
+_INDEX_CACHE = {"signature": None, "data": {}}
+# 对话文件名模式：任意时间戳 + UUID
+_CONV_FILE_RE = re.compile(r"^\d{1,2}-\d{1,2}-\d{1,2}-(.+?)\.json$")
+# 文件路径末尾的行号范围，如 :10-20
+_LINE_RANGE_RE = re.compile(r":(\d+)?-(\d+)?$")
 
-INDEX_PATH = Path(__file__).parent / "conversation" / "index.json"
 
+def _json_dumps_bytes(obj):
+    """序列化为带缩进的UTF-8字节，优先使用orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
 
-def _ensure_index():
-    """确保索引文件存在，不存在则创建空索引"""
-    if not INDEX_PATH.exists():
-        INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
-        with open(INDEX_PATH, "w", encoding="utf8") as f:
-            json.dump({}, f)
+
+def _json_loads(data):
+    """解析JSON文本或字节，优先使用orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def _update_index(uuid, file_path):
-    """更新索引文件"""
-    _ensure_index()
-    with open(INDEX_PATH, "r+", encoding="utf8") as f:
-        index = json.load(f)
-        index[uuid] = str(file_path)
-        f.seek(0)
-        json.dump(index, f, indent=4)
-        f.truncate()
+    """追加一条索引记录，无需重写整个index.json
 
+    调用方(new_conversation)已创建对话日期目录，索引所在目录必然存在，这里不再检查
+    """
+    with open(INDEX_LOG_PATH, "a", encoding="utf8") as f:
+        f.write(json.dumps({"uuid": uuid, "path": str(file_path)}) + "\n")
 
-def _build_index():
-    """遍历目录构建索引"""
-    index = {}
-    conv_dir = Path(__file__).parent / "conversation"
 
-    # 匹配文件名模式：任意时间戳 + UUID
-    pattern = re.compile(r"^\d{1,2}-\d{1,2}-\d{1,2}-(.+?)\.json$")
+def _write_index(index):
+    """原子地写入index.json快照并清空追加日志"""
+    tmp_path = INDEX_PATH.with_name(INDEX_PATH.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_json_dumps_bytes(index))
+    os.replace(tmp_path, INDEX_PATH)
+    try:
+        INDEX_LOG_PATH.unlink()
+    except FileNotFoundError:
+        pass
 
-    for root, _, files in os.walk(conv_dir):
-        for filename in files:
-            # 跳过索引文件本身
-            if filename == "index.json":
-                continue
 
-            match = pattern.match(filename)
-            if match:
-                uuid = match.group(1)
-                full_path = Path(root) / filename
-                index[uuid] = str(full_path)
+def _index_signature():
+    """索引文件的(路径, 修改时间, 大小)签名，文件不存在时对应项为None"""
+    signature = []
+    for path in (INDEX_PATH, INDEX_LOG_PATH):
+        try:
+            stat = os.stat(path)
+            signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((str(path), None))
+    return tuple(signature)
+
+
+def _load_index():
+    """读取索引，文件未变化时直接返回缓存，避免每次查找都重新解析"""
+    # 签名在读取前获取：读取期间其他进程追加的记录会使签名变化，下次查找时重新读取
+    signature = _index_signature()
+    if signature == _INDEX_CACHE["signature"]:
+        return _INDEX_CACHE["data"]
+    index, compacted = _read_index()
+    if compacted:
+        signature = _index_signature()
+    _INDEX_CACHE["signature"] = signature
+    _INDEX_CACHE["data"] = index
+    return index
 
-    with open(INDEX_PATH, "w", encoding="utf8") as f:
-        json.dump(index, f, indent=4)
 
+def _read_index():
+    """读取index.json快照并合并追加日志中的记录，返回(索引, 是否压缩了追加日志)"""
+    try:
+        with open(INDEX_PATH, "rb") as f:
+            index = _json_loads(f.read())
+    except FileNotFoundError:
+        index = {}
+
+    log_entries = 0
+    try:
+        with open(INDEX_LOG_PATH, "r", encoding="utf8") as f:
+            for line in f:
+                try:
+                    entry = _json_loads(line)
+                    index[entry["uuid"]] = entry["path"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    # 写入中断留下的残缺行，跳过即可
+                    continue
+                log_entries += 1
+    except FileNotFoundError:
+        pass
+
+    if log_entries >= _INDEX_LOG_COMPACT_THRESHOLD:
+        _write_index(index)
+        return index, True
+    return index, False
+
+
+def _build_index():
+    """遍历目录构建索引"""
+    index = {}
+    conv_dir = _CONV_DIR
+
+    # 文件名模式以时间戳开头，index.json等其它文件不会匹配
+    for full_path in conv_dir.rglob("*.json"):
+        match = _CONV_FILE_RE.match(full_path.name)
+        if match:
+            index[match.group(1)] = str(full_path)
+
+    conv_dir.mkdir(parents=True, exist_ok=True)
+    _write_index(index)
     return index
 
 
@@ -389,13 +477,12 @@ def get_conversation(uuid):
     """获取对话记录"""
     try:
         # 先尝试读取索引
-        with open(INDEX_PATH, "r", encoding="utf8") as f:
-            index = json.load(f)
-            if uuid in index:
-                path = Path(index[uuid])
-                if path.exists():
-                    return path
-    except (FileNotFoundError, json.JSONDecodeError):
+        index = _load_index()
+        if uuid in index:
+            path = Path(index[uuid])
+            if path.exists():
+                return path
+    except json.JSONDecodeError:
         pass
 
     # 索引不存在或查找失败，重新构建索引
@@ -415,7 +502,7 @@ def new_conversation(uuid):
     time_str = current_datetime.strftime("%H-%M-%S")
 
     # 构建完整路径
-    base_dir = Path(__file__).parent / "conversation" / date_dir
+    base_dir = _CONV_DIR / date_dir
     filename = f"{time_str}-{uuid}.json"
     file_path = base_dir / filename
 
@@ -423,8 +510,8 @@ def new_conversation(uuid):
     base_dir.mkdir(parents=True, exist_ok=True)
 
     # 写入初始数据并更新索引
-    with open(file_path, "w", encoding="utf8") as f:
-        json.dump([], f, indent=4)
+    with open(file_path, "wb") as f:
+        f.write(_json_dumps_bytes([]))
 
     _update_index(uuid, file_path)
     return str(file_path)
@@ -434,8 +521,8 @@ def load_conversation_history(file_path):
     """加载对话历史文件"""
     try:
         if os.path.exists(file_path):
-            with open(file_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(file_path, "rb") as f:
+                return _json_loads(f.read())
         return []
     except (IOError, json.JSONDecodeError) as e:
         print(f"加载对话历史失败: {e}")
@@ -443,12 +530,20 @@ def load_conversation_history(file_path):
 
 
 def save_conversation_history(file_path, history):
-    """保存对话历史到文件"""
+    """保存对话历史到文件，先整体序列化再一次写入临时文件并原子替换"""
+    data = _json_dumps_bytes(history)
+    tmp_path = f"{file_path}.tmp"
     try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
     except IOError as e:
         print(f"保存对话历史失败: {e}")
+        # 写入或替换失败时清理临时文件，避免残留在历史文件旁
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
 
 
 def query_gpt_api(
@@ -533,7 +628,7 @@ def get_conversation_file(file):
         except FileNotFoundError:
             conversation_file = new_conversation(cid)
     else:
-        conversation_file = os.path.join(os.path.dirname(__file__), "conversation_history.json")
+        conversation_file = os.path.join(_MODULE_DIR, "conversation_history.json")
     return conversation_file
 
 
@@ -554,6 +649,12 @@ def _initialize_conversation_history(kwargs: dict) -> list:
     return load_conversation_history(get_conversation_file(conversation_file))
 
 
+@functools.lru_cache(maxsize=8)
+def _get_openai_client(api_key: str, base_url: Optional[str]) -> OpenAI:
+    """按(api_key, base_url)复用客户端，多轮对话可复用已建立的HTTP连接"""
+    return OpenAI(api_key=api_key, base_url=base_url)
+
+
 def _get_api_response(
     api_key: str,
     model: str,
@@ -571,7 +672,7 @@ def _get_api_response(
     返回:
         Generator: 流式响应生成器
     """
-    client = OpenAI(api_key=api_key, base_url=kwargs.get("base_url"))
+    client = _get_openai_client(api_key, kwargs.get("base_url"))
     if "gemini" in model.lower():
         extra_body = {}
     else:
@@ -638,25 +739,89 @@ def _process_stream_response(stream_client, **kwargs) -> tuple:
     返回:
         tuple: (正式内容, 推理内容)
     """
-    content = ""
-    reasoning = ""
+    content_parts = []
+    reasoning_parts = []
     console = kwargs.get("console")
     verbose = kwargs.get("verbose", True)
-    for chunk in stream_client:
-        # 处理推理内容
-        if hasattr(chunk.choices[0].delta, "reasoning_content") and chunk.choices[0].delta.reasoning_content:
-            if verbose:
-                _print_content(chunk.choices[0].delta.reasoning_content, console, style="#00ff00")
-            reasoning += chunk.choices[0].delta.reasoning_content
-
-        # 处理正式回复内容
-        if chunk.choices[0].delta.content:
-            if verbose:
-                _print_content(chunk.choices[0].delta.content, console)
-            content += chunk.choices[0].delta.content
-    if verbose:
+    printer = _StreamPrinter(console) if verbose else None
+    try:
+        for chunk in stream_client:
+            delta = chunk.choices[0].delta
+            # 处理推理内容
+            reasoning_content = getattr(delta, "reasoning_content", None)
+            if reasoning_content:
+                if printer:
+                    printer.write(reasoning_content, style="#00ff00")
+                reasoning_parts.append(reasoning_content)
+
+            # 处理正式回复内容
+            delta_content = delta.content
+            if delta_content:
+                if printer:
+                    printer.write(delta_content)
+                content_parts.append(delta_content)
+    finally:
+        # 流被中断时也立即输出缓存并取消定时器，避免调用方返回后才由定时器线程输出
+        if printer:
+            printer.flush()
+    if printer:
         _print_newline(console)
-    return content, reasoning
+    return "".join(content_parts), "".join(reasoning_parts)
+
+
+def _stream_render_interval() -> float:
+    """流式输出的最小刷新间隔(秒)，由LLM_STREAM_INTERVAL_MS配置，0表示逐个增量输出"""
+    try:
+        return max(int(os.getenv("LLM_STREAM_INTERVAL_MS", "100")), 0) / 1000
+    except ValueError:
+        return 0.1
+
+
+class _StreamPrinter:
+    """合并流式增量后按最小间隔输出，避免每个token都触发一次控制台渲染
+
+    样式切换时先输出已缓存的内容，保证推理内容与正式内容的先后顺序不变；
+    缓存中有内容时启动定时器，流中途停顿时最迟一个间隔后也会输出
+    """
+
+    def __init__(self, console, interval: float = None):
+        self.console = console
+        self.interval = _stream_render_interval() if interval is None else interval
+        self.pending = []
+        self.pending_style = None
+        # 第一个增量立即输出
+        self.last_flush = float("-inf")
+        self._lock = threading.RLock()
+        self._timer = None
+
+    def write(self, text: str, style=None) -> None:
+        with self._lock:
+            if self.pending and style != self.pending_style:
+                self.flush()
+            self.pending.append(text)
+            self.pending_style = style
+            remaining = self.interval - (time.monotonic() - self.last_flush)
+            if remaining <= 0:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(remaining, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self.pending:
+                _print_content("".join(self.pending), self.console, style=self.pending_style)
+                self.pending.clear()
+            self.last_flush = time.monotonic()
+
+
+# 一次扫描提取<think>...</think>块，第二个用于缺少开始标签的情况
+_THINK_BLOCK_RE = re.compile(r"<think>(.*?)</think>\n\n", re.DOTALL)
+_THINK_END_RE = re.compile(r"(.*?)</think>\n\n", re.DOTALL)
 
 
 def _handle_think_tags(content: str, reasoning: str) -> tuple:
@@ -669,22 +834,16 @@ def _handle_think_tags(content: str, reasoning: str) -> tuple:
     返回:
         tuple: 处理后的内容和推理内容
     """
-    thinking_end_tag = "</think>\n\n"
-    thinking_start_tag = "<think>"
-
-    if content and (content.find(thinking_end_tag) != -1 or content.find(thinking_start_tag) != -1):
-        if content.find(thinking_start_tag) != -1:
-            pos_start = content.find(thinking_start_tag)
-            pos_end = content.find(thinking_end_tag)
-            if pos_end != -1:
-                reasoning = content[pos_start + len(thinking_start_tag) : pos_end]
-                reasoning = reasoning.replace("\\n", "\n")
-                content = content[pos_end + len(thinking_end_tag) :]
-        else:
-            pos = content.find(thinking_end_tag)
-            reasoning = content[:pos]
-            reasoning = reasoning.replace("\\n", "\n")
-            content = content[pos + len(thinking_end_tag) :]
+    if not content:
+        return content, reasoning
+
+    match = _THINK_BLOCK_RE.search(content)
+    if match is None and "<think>" not in content:
+        # 只有结束标签时，开头到结束标签之间都是推理内容
+        match = _THINK_END_RE.match(content)
+    if match:
+        reasoning = match.group(1).replace("\\n", "\n")
+        content = content[match.end() :]
 
     return content, reasoning
 
@@ -715,6 +874,10 @@ def _print_newline(console) -> None:
         print()
 
 
+# 工具名 -> 是否能在PATH中找到
+_TOOL_CACHE: Dict[str, bool] = {}
+
+
 def _check_tool_installed(
     tool_name: str,
     install_url: str | None = None,
@@ -746,25 +909,20 @@ def _check_tool_installed(
         print("参数校验失败: install_commands需要字符串列表")
         return False
 
-    try:
-        check_cmd = ["where", tool_name] if sys.platform == "win32" else ["which", tool_name]
-        subprocess.run(
-            check_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True,
-            text=True,
-        )
+    # 进程内查找PATH，无需为每个工具派生which/where子进程，结果按工具名缓存
+    installed = _TOOL_CACHE.get(tool_name)
+    if installed is None:
+        installed = _TOOL_CACHE[tool_name] = shutil.which(tool_name) is not None
+    if installed:
         return True
-    except subprocess.CalledProcessError:
-        print(f"依赖缺失: {tool_name} 未安装")
-        if install_url:
-            print(f"|-- 安装文档: {install_url}")
-        if install_commands:
-            print("|-- 可用安装命令:")
-            for cmd in install_commands:
-                print(f"|   {cmd}")
-        return False
+    print(f"依赖缺失: {tool_name} 未安装")
+    if install_url:
+        print(f"|-- 安装文档: {install_url}")
+    if install_commands:
+        print("|-- 可用安装命令:")
+        for cmd in install_commands:
+            print(f"|   {cmd}")
+    return False
 
 
 def check_deps_installed() -> bool:
@@ -850,56 +1008,89 @@ def get_directory_context_wrapper(tag):
     return f"\n[directory tree start]\n{text}\n[directory tree end]\n"
 
 
+# (目录, 层级) -> (目录mtime, 输出)，只缓存单层目录：更深层的变化不会更新顶层目录的mtime
+_DIR_CONTEXT_CACHE: Dict[tuple, tuple] = {}
+
+
 def get_directory_context(max_depth=1, current_dir: Optional[str] = None):
     """获取当前目录上下文信息（支持动态层级控制）"""
     try:
         if not current_dir:
             current_dir = os.getcwd()
-        # Windows系统处理
-        if sys.platform == "win32":
-            if max_depth == 1:
-                # 当max_depth为1时使用dir命令
-                dir_result = subprocess.run(["dir"], stdout=subprocess.PIPE, text=True, shell=True, check=True)
-                msg = dir_result.stdout or "无法获取目录信息"
-                return f"\n当前工作目录: {current_dir}\n\n目录结构:\n{msg}"
-            # 其他情况使用tree命令
-            cmd = ["tree"]
-            if max_depth is not None:
-                cmd.extend(["/A", "/F"])
+        if max_depth != 1:
+            return _list_directory(max_depth, current_dir)[0]
+
+        signature = _dir_context_signature(current_dir)
+        key = (current_dir, max_depth)
+        cached = _DIR_CONTEXT_CACHE.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+        text, from_tree = _list_directory(max_depth, current_dir)
+        # dir/ls -l的输出含文件大小和时间，不随目录mtime变化，只缓存tree的结果
+        if from_tree:
+            _DIR_CONTEXT_CACHE[key] = (signature, text)
         else:
-            # 非Windows系统使用Linux/macOS的tree命令
-            cmd = ["tree", current_dir]
-            if max_depth is not None:
-                cmd.extend(["-L", str(max_depth)])
-            # 添加gitignore支持
-            cmd.append("--gitignore")
+            _DIR_CONTEXT_CACHE.pop(key, None)
+        return text
+    except (OSError, subprocess.SubprocessError) as e:
+        return f"获取目录上下文时出错: {str(e)}"
 
+
+def _dir_context_signature(current_dir: str) -> tuple:
+    """目录树缓存的校验值：目录本身及其生效的.gitignore(tree --gitignore依赖)的修改时间"""
+    signature = [os.stat(current_dir).st_mtime_ns]
+    for gitignore in (os.path.join(current_dir, ".gitignore"), _find_gitignore(current_dir)):
         try:
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=True,
-                text=True,
-                shell=(sys.platform == "win32"),
-            )
-            output = result.stdout
-            return f"\n当前工作目录: {current_dir}\n\n目录结构:\n{output}"
-        except subprocess.CalledProcessError:
-            # 当tree命令失败时使用替代命令
-            if sys.platform == "win32":
-                # Windows使用dir命令
-                dir_result = subprocess.run(["dir"], stdout=subprocess.PIPE, check=True, text=True, shell=True)
-                msg = dir_result.stdout or "无法获取目录信息"
-            else:
-                # 非Windows使用ls命令
-                ls_result = subprocess.run(["ls", "-l"], stdout=subprocess.PIPE, text=True, check=True)
-                msg = ls_result.stdout or "无法获取目录信息"
+            signature.append(os.stat(gitignore).st_mtime_ns if gitignore else None)
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
 
-            return f"\n当前工作目录: {current_dir}\n\n目录结构:\n{msg}"
 
-    except (OSError, subprocess.SubprocessError) as e:
-        return f"获取目录上下文时出错: {str(e)}"
+def _list_directory(max_depth, current_dir: str) -> tuple:
+    """调用tree/dir/ls列出目录结构，返回(文本, 是否来自tree命令)"""
+    # Windows系统处理
+    if sys.platform == "win32":
+        if max_depth == 1:
+            # 当max_depth为1时使用dir命令
+            dir_result = subprocess.run(["dir"], stdout=subprocess.PIPE, text=True, shell=True, check=True)
+            msg = dir_result.stdout or "无法获取目录信息"
+            return f"\n当前工作目录: {current_dir}\n\n目录结构:\n{msg}", False
+        # 其他情况使用tree命令
+        cmd = ["tree"]
+        if max_depth is not None:
+            cmd.extend(["/A", "/F"])
+    else:
+        # 非Windows系统使用Linux/macOS的tree命令
+        cmd = ["tree", current_dir]
+        if max_depth is not None:
+            cmd.extend(["-L", str(max_depth)])
+        # 添加gitignore支持
+        cmd.append("--gitignore")
+
+    try:
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            text=True,
+            shell=(sys.platform == "win32"),
+        )
+        output = result.stdout
+        return f"\n当前工作目录: {current_dir}\n\n目录结构:\n{output}", True
+    except subprocess.CalledProcessError:
+        # 当tree命令失败时使用替代命令
+        if sys.platform == "win32":
+            # Windows使用dir命令
+            dir_result = subprocess.run(["dir"], stdout=subprocess.PIPE, check=True, text=True, shell=True)
+            msg = dir_result.stdout or "无法获取目录信息"
+        else:
+            # 非Windows使用ls命令
+            ls_result = subprocess.run(["ls", "-l"], stdout=subprocess.PIPE, text=True, check=True)
+            msg = ls_result.stdout or "无法获取目录信息"
+
+        return f"\n当前工作目录: {current_dir}\n\n目录结构:\n{msg}", False
 
 
 def get_clipboard_content(_):
@@ -912,6 +1103,7 @@ class ClipboardMonitor:
     def __init__(self, debug=False):
         self.collected_contents = []
         self.should_stop = False
+        self._stop_event = threading.Event()
         self.lock = threading.Lock()
         self.monitor_thread = None
         self.debug = debug
@@ -928,9 +1120,16 @@ class ClipboardMonitor:
         initial_content = None  # 用于存储第一次获取的内容
         first_run = True  # 标记是否是第一次运行
         ignore_initial = True  # 标记是否继续忽略初始内容
+        last_sequence = None
         self._debug_print("开始执行剪贴板监控线程")
         while not self.should_stop:
             try:
+                sequence = _get_clipboard_sequence_number()
+                if sequence is not None and sequence == last_sequence:
+                    # 剪贴板未发生变化，无需读取内容
+                    self._stop_event.wait(0.5)
+                    continue
+                last_sequence = sequence
                 self._debug_print("尝试获取剪贴板内容...")
                 current_content = get_clipboard_content_string()
 
@@ -940,13 +1139,14 @@ class ClipboardMonitor:
                     first_run = False
                     self._debug_print("忽略初始剪贴板内容")
                 elif current_content and current_content != last_content:
-                    # 当内容不为空且与上次不同时
-                    if ignore_initial and current_content != initial_content:
+                    # 当内容不为空且与上次不同时，与初始内容只比较一次
+                    differs_from_initial = current_content != initial_content
+                    if ignore_initial and differs_from_initial:
                         # 如果还在忽略初始内容阶段，且当前内容不等于初始内容
                         ignore_initial = False  # 停止忽略初始内容
                         self._debug_print("检测到内容变化，停止忽略初始内容")
 
-                    if not ignore_initial or current_content != initial_content:
+                    if not ignore_initial or differs_from_initial:
                         # 如果已经停止忽略初始内容，或者当前内容不等于初始内容
                         with self.lock:
                             print(f"获得片断: ${current_content}")
@@ -958,7 +1158,7 @@ class ClipboardMonitor:
                 else:
                     self._debug_print("内容未变化/为空，跳过保存")
 
-                time.sleep(0.5)
+                self._stop_event.wait(0.5)
 
             except Exception as e:
                 self._debug_print(f"剪贴板监控出错: {str(e)}")
@@ -970,6 +1170,7 @@ class ClipboardMonitor:
         """启动剪贴板监控"""
         self._debug_print("准备启动剪贴板监控...")
         self.should_stop = False
+        self._stop_event.clear()
         self.monitor_thread = threading.Thread(target=self._monitor_clipboard)
         self.monitor_thread.daemon = True
         self.monitor_thread.start()
@@ -980,6 +1181,7 @@ class ClipboardMonitor:
         """停止剪贴板监控"""
         self._debug_print("准备停止剪贴板监控...")
         self.should_stop = True
+        self._stop_event.set()
 
         if self.monitor_thread and self.monitor_thread.is_alive():
             self._debug_print("等待监控线程结束...")
@@ -1023,11 +1225,11 @@ def monitor_clipboard(_, debug=False):
             import select
 
             while not monitor.should_stop:
-                if select.select([sys.stdin], [], [], 0)[0]:
+                # 在select中等待输入，回车后立即返回而不是等到下一次轮询
+                if select.select([sys.stdin], [], [], 0.1)[0]:
                     if sys.stdin.read(1) == "\n":
                         print("检测到回车键")
                         break
-                time.sleep(0.1)
 
     except KeyboardInterrupt:
         print("\n用户中断操作")
@@ -1038,6 +1240,16 @@ def monitor_clipboard(_, debug=False):
     return result
 
 
+def _get_clipboard_sequence_number():
+    """获取剪贴板变更序号，平台不支持时返回None，由调用方直接读取内容比较"""
+    if sys.platform != "win32":
+        return None
+    try:
+        return __import__("win32clipboard").GetClipboardSequenceNumber()
+    except (ImportError, AttributeError):
+        return None
+
+
 def get_clipboard_content_string():
     """获取剪贴板内容的封装函数，统一返回字符串内容，支持图像输出到临时目录"""
     try:
@@ -1165,7 +1377,7 @@ def _get_linux_text_content():
         result = subprocess.run(
             ["xclip", "-selection", "clipboard", "-o"],
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             text=True,
             check=True,
         )
@@ -1174,7 +1386,7 @@ def _get_linux_text_content():
         result = subprocess.run(
             ["xsel", "--clipboard", "--output"],
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             text=True,
             check=True,
         )
@@ -1184,8 +1396,6 @@ def _get_linux_text_content():
 def _handle_linux_image():
     """处理Linux剪贴板中的图像内容"""
     try:
-        import tempfile
-
         temp_dir = tempfile.gettempdir()
         image_path = os.path.join(temp_dir, f"clipboard_image_{int(time.time())}.png")
 
@@ -1199,14 +1409,29 @@ def _handle_linux_image():
         return "[clipboard contains non-text data]"
 
 
+# requests.Session不保证线程安全，线程池中的每个线程各自持有一个会话
+_FETCH_SESSIONS = threading.local()
+
+
+def _get_fetch_session():
+    """获取当前线程复用的HTTP会话，多次请求本地转换服务和符号服务时保持长连接
+
+    会话不读取环境变量中的代理设置，无需再临时清除代理环境变量
+    """
+    session = getattr(_FETCH_SESSIONS, "session", None)
+    if session is None:
+        session = requests.Session()
+        # 确保不使用任何代理
+        session.trust_env = False  # 禁用从环境变量读取代理
+        _FETCH_SESSIONS.session = session
+    return session
+
+
 def fetch_url_content(url, is_news=False):
     """通过API获取URL对应的Markdown内容"""
     try:
         api_url = f"http://127.0.0.1:8000/convert?url={url}&is_news={is_news}"
-        # 确保不使用任何代理
-        session = requests.Session()
-        session.trust_env = False  # 禁用从环境变量读取代理
-        response = session.get(api_url)
+        response = _get_fetch_session().get(api_url)
         response.raise_for_status()
         return response.text
     except requests.exceptions.RequestException as e:
@@ -1358,12 +1583,26 @@ def _handle_local_file(match: CmdNode, enable_line: bool = False) -> str:
     return f"\n\n[error]: 路径不存在 {expanded_path}\n\n"
 
 
+# 用户主目录在进程内不变，导入时展开一次
+_HOME_DIR = os.path.expanduser("~")
+_HOME_PREFIX = _HOME_DIR.rstrip("/" + os.sep)
+
+
+def _expand_home(path: str) -> str:
+    """展开路径开头的~，当前用户的主目录直接拼接缓存值，~user等形式仍交给expanduser"""
+    if not path.startswith("~"):
+        return path
+    if path == "~":
+        return _HOME_DIR
+    if path[1] == "/" or path[1] == os.sep:
+        return _HOME_PREFIX + path[1:]
+    return os.path.expanduser(path)
+
+
 def _expand_file_path(command: str) -> tuple:
     """展开文件路径并解析行号范围"""
-    line_range_match = re.search(r":(\d+)?-(\d+)?$", command)
-    expanded_path = os.path.abspath(
-        os.path.expanduser(command[: line_range_match.start()] if line_range_match else command)
-    )
+    line_range_match = _LINE_RANGE_RE.search(command)
+    expanded_path = os.path.abspath(_expand_home(command[: line_range_match.start()] if line_range_match else command))
     return expanded_path, line_range_match
 
 
@@ -1383,18 +1622,17 @@ def _process_single_file(file_path: str, line_range_match: re.Match, enable_line
 
 
 def _read_file_content(file_obj, line_range_match: re.Match) -> str:
-    """读取文件内容并处理行号范围"""
-    lines = file_obj.readlines()
+    """读取文件内容并处理行号范围，指定范围时只逐行读取到结束行为止"""
     if not line_range_match:
-        return "".join(lines)
+        return file_obj.read()
 
     start_str = line_range_match.group(1)
     end_str = line_range_match.group(2)
-    start = int(start_str) - 1 if start_str else 0
-    end = int(end_str) if end_str else len(lines)
-    start = max(0, start)
-    end = min(len(lines), end)
-    return "".join(lines[start:end])
+    start = max(0, int(start_str) - 1) if start_str else 0
+    end = int(end_str) if end_str else None
+    if end is not None and end <= start:
+        return ""
+    return "".join(itertools.islice(file_obj, start, end))
 
 
 def _format_file_content(file_path: str, content: str) -> str:
@@ -1402,36 +1640,50 @@ def _format_file_content(file_path: str, content: str) -> str:
     return f"\n\n[file name]: {file_path}\n[start]\n{content}\n[end]\n\n"
 
 
+# 目录并发读取的线程数上限，避免文件描述符耗尽
+_DIR_READ_WORKERS = 16
+
+
+def _read_directory_file(item: tuple) -> str:
+    """读取目录中的单个文件并格式化，二进制文件返回空字符串"""
+    file_path, rel_path = item
+    if _is_binary_file(file_path):
+        return ""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return _format_file_content(rel_path, f.read())
+    except UnicodeDecodeError:
+        return f"[file name]: {rel_path}\n[start]\n二进制文件或无法解码\n[end]\n\n"
+    except (OSError, IOError) as e:
+        return f"[file error]: 无法读取文件 {rel_path}: {str(e)}\n\n"
+
+
 def _process_directory(dir_path: str) -> str:
     """处理目录内容"""
     gitignore_path = _find_gitignore(dir_path)
     root_dir = os.path.dirname(gitignore_path) if gitignore_path else dir_path
     is_ignored = _parse_gitignore(gitignore_path, root_dir) if gitignore_path else lambda x: False
+    is_ignored_dir = getattr(is_ignored, "is_ignored_dir", lambda name: False)
 
     # 获取目录树
     tree_content = get_directory_context(max_depth=1024, current_dir=dir_path)
 
-    # 处理目录中的文件
-    file_contents = []
+    # 先收集待读取的文件，再并发读取，输出顺序与遍历顺序一致
+    file_paths = []
     for root, dirs, files in os.walk(dir_path):
-        # 过滤被忽略的目录
-        dirs[:] = [d for d in dirs if not is_ignored(os.path.join(root, d))]
+        # 过滤被忽略的目录，先用目录名快速判断(.git、node_modules等)，避免逐个计算相对路径
+        dirs[:] = [d for d in dirs if not (is_ignored_dir(d) or is_ignored(os.path.join(root, d)))]
 
         for file in files:
             file_path = os.path.join(root, file)
-            rel_path = os.path.relpath(file_path, dir_path)
-
-            if is_ignored(file_path) or _is_binary_file(file_path):
-                continue
+            if not is_ignored(file_path):
+                file_paths.append((file_path, os.path.relpath(file_path, dir_path)))
 
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                    file_contents.append(_format_file_content(rel_path, content))
-            except UnicodeDecodeError:
-                file_contents.append(f"[file name]: {rel_path}\n[start]\n二进制文件或无法解码\n[end]\n\n")
-            except (OSError, IOError) as e:
-                file_contents.append(f"[file error]: 无法读取文件 {rel_path}: {str(e)}\n\n")
+    if len(file_paths) > 1:
+        with ThreadPoolExecutor(max_workers=min(_DIR_READ_WORKERS, len(file_paths))) as executor:
+            file_contents = list(executor.map(_read_directory_file, file_paths))
+    else:
+        file_contents = [_read_directory_file(item) for item in file_paths]
 
     # 组合目录树和文件内容
     return (
@@ -1444,10 +1696,9 @@ def _process_directory(dir_path: str) -> str:
     )
 
 
-def _is_binary_file(file_path: str) -> bool:
-    """检测文件是否为二进制文件"""
-    # 压缩后的二进制文件扩展名列表
-    binary_exts = (
+# 压缩后的二进制文件扩展名集合，模块加载时构建一次
+_BINARY_EXTS = frozenset(
+    (
         ".png.jpg.jpeg.gif.bmp.tiff.webp.svg.mp4.avi.mov.mkv.flv.wmv.webm.mp3.wav.ogg.flac.aac"
         ".zip.rar.7z.tar.gz.bz2.exe.dll.so.dylib.bin.pdf.doc.docx.xls.xlsx.pptx.ppt"
         ".psd.ai.eps.indd.pct.pict.pcx.pdd.pmp.ppam.pps.ppsm.pptm.pub.xps.xlt.xltm.xlam"
@@ -1466,33 +1717,30 @@ def _is_binary_file(file_path: str) -> bool:
         ".vmdk.vhd.vdi.vhdx.qcow.qcow2.vmdk"
         ".ova.ovf"
         ".bak.tmp.temp"
-    )
+    ).split(".")
+)
+_BINARY_MAGIC_PREFIXES = tuple(BINARY_MAGIC_NUMBERS)
+
 
+def _is_binary_file(file_path: str) -> bool:
+    """检测文件是否为二进制文件"""
     # 首先检查文件扩展名
     file_ext = os.path.splitext(file_path)[1].lower()
-    if file_ext:  # 确保有扩展名
-        # 将扩展名列表转换为集合以便快速查找
-        ext_set = set(binary_exts.split("."))
-        # 去掉点号后检查是否在集合中
-        if file_ext[1:] in ext_set:
-            return True
+    if file_ext and file_ext[1:] in _BINARY_EXTS:
+        return True
 
     # 然后检查文件magic number
     try:
         with open(file_path, "rb") as f:
             header = f.read(12)  # 读取更多字节以确保检测准确性
-            for magic in BINARY_MAGIC_NUMBERS:
-                if header.startswith(magic):
-                    return True
+            return header.startswith(_BINARY_MAGIC_PREFIXES)
     except (OSError, IOError):
         return True
 
-    return False
-
 
 def _process_glob_pattern(pattern: str) -> str:
     """处理通配符模式匹配文件"""
-    replacement = f"\n\n[glob pattern]: {pattern}\n"
+    parts = [f"\n\n[glob pattern]: {pattern}\n"]
     try:
         for file_path in glob.glob(pattern, recursive=True):
             if os.path.isdir(file_path) or _is_binary_file(file_path):
@@ -1500,15 +1748,15 @@ def _process_glob_pattern(pattern: str) -> str:
             try:
                 with open(file_path, "r", encoding="utf-8") as f:
                     content = f.read()
-                    replacement += _format_file_content(file_path, content)
+                    parts.append(_format_file_content(file_path, content))
             except UnicodeDecodeError:
-                replacement += f"[file name]: {file_path}\n[start]\n二进制文件或无法解码\n[end]\n\n"
+                parts.append(f"[file name]: {file_path}\n[start]\n二进制文件或无法解码\n[end]\n\n")
             except (OSError, IOError) as e:
-                replacement += f"[file error]: 无法读取文件 {file_path}: {str(e)}\n\n"
+                parts.append(f"[file error]: 无法读取文件 {file_path}: {str(e)}\n\n")
     except Exception as e:
-        replacement += f"[glob error]: 通配符模式处理失败: {str(e)}\n\n"
-    replacement += f"[glob pattern end]: {pattern}\n\n"
-    return replacement
+        parts.append(f"[glob error]: 通配符模式处理失败: {str(e)}\n\n")
+    parts.append(f"[glob pattern end]: {pattern}\n\n")
+    return "".join(parts)
 
 
 def _find_gitignore(path: str) -> str:
@@ -1530,56 +1778,119 @@ def _find_gitignore(path: str) -> str:
         current = parent
 
 
-def _parse_gitignore(gitignore_path: str, root_dir: str) -> callable:
-    """解析.gitignore文件生成过滤函数"""
+def _load_gitignore_patterns(gitignore_path: str) -> tuple:
+    """读取.gitignore中的模式"""
     patterns = []
-    if gitignore_path and os.path.isfile(gitignore_path):
+    try:
+        with open(gitignore_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    patterns.append(line)
+    except (IOError, UnicodeDecodeError) as e:
+        logging.warning("解析.gitignore失败: %s", str(e))
+    return tuple(patterns)
+
+
+# fnmatch中的通配字符
+_GLOB_CHARS_RE = re.compile(r"[*?\[]")
+_DEFAULT_IGNORE_PATTERNS = (
+    "__pycache__/",
+    "node_modules/",
+    "venv/",
+    "dist/",
+    "build/",
+    "*.py[cod]",
+    "*.so",
+    "*.egg-info",
+    "*.jpg",
+    "*.jpeg",
+    "*.png",
+    "*.gif",
+    "*.pdf",
+    "*.zip",
+    ".*",
+)
+
+
+def _parse_gitignore(gitignore_path: str, root_dir: str) -> callable:
+    """解析.gitignore文件生成过滤函数，.gitignore未修改时复用已编译的过滤函数"""
+    mtime_ns = None
+    if gitignore_path:
         try:
-            with open(gitignore_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith("#"):
-                        patterns.append(line)
-        except (IOError, UnicodeDecodeError) as e:
-            logging.warning("解析.gitignore失败: %s", str(e))
-
-    default_patterns = [
-        "__pycache__/",
-        "node_modules/",
-        "venv/",
-        "dist/",
-        "build/",
-        "*.py[cod]",
-        "*.so",
-        "*.egg-info",
-        "*.jpg",
-        "*.jpeg",
-        "*.png",
-        "*.gif",
-        "*.pdf",
-        "*.zip",
-        ".*",
-    ]
-    patterns.extend(default_patterns)
+            mtime_ns = os.stat(gitignore_path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+    if mtime_ns is None:
+        gitignore_path = None
+    return _build_ignore_matcher(gitignore_path, root_dir, mtime_ns)
+
+
+@functools.lru_cache(maxsize=64)
+def _build_ignore_matcher(gitignore_path: Optional[str], root_dir: str, _mtime_ns: Optional[int]) -> callable:
+    """按(.gitignore路径, 根目录, 修改时间)缓存编译好的过滤函数，文件变化后自动重建
+
+    _mtime_ns只作为lru_cache的键参与缓存，函数体内不使用
+    """
+    patterns = list(_load_gitignore_patterns(gitignore_path)) if gitignore_path else []
+    patterns.extend(_DEFAULT_IGNORE_PATTERNS)
+
+    # fnmatch.fnmatch会对两边做normcase，大小写不敏感的平台上保持一致
+    ignore_case = os.path.normcase("A") != "A"
+    # 不含通配符的目录/文件名和纯"*.后缀"模式用集合与endswith判断，其余模式才走正则
+    literal_names = set()
+    suffixes = []
+    glob_patterns = []
+    for pattern in patterns:
+        pattern = pattern.rstrip("/")
+        if ignore_case or "/" in pattern:
+            glob_patterns.append(pattern)
+        elif not _GLOB_CHARS_RE.search(pattern):
+            literal_names.add(pattern)
+        elif pattern.startswith("*") and not _GLOB_CHARS_RE.search(pattern, 1):
+            suffixes.append(pattern[1:])
+        else:
+            glob_patterns.append(pattern)
+    suffixes = tuple(suffixes)
+    # "*.后缀/*"中的*可以跨越路径分隔符，任意一级目录以该后缀结尾都算匹配
+    suffix_dirs = tuple(suffix + "/" for suffix in suffixes)
+
+    # 每个通配模式只翻译一次，合并为两个正则：相对路径(含"模式/*"展开)和文件名
+    rel_regex = base_regex = None
+    if glob_patterns:
+        flags = re.IGNORECASE if ignore_case else 0
+        translated = [fnmatch.translate(pattern) for pattern in glob_patterns]
+        translated_dir = [fnmatch.translate(pattern + "/*") for pattern in glob_patterns]
+        rel_regex = re.compile("|".join(translated + translated_dir), flags)
+        base_regex = re.compile("|".join(translated), flags)
+    need_sep_replace = os.sep != "/"
 
     def _is_ignored(file_path: str) -> bool:
         """判断文件路径是否被忽略"""
         try:
             rel_path = os.path.relpath(file_path, root_dir)
-            rel_posix = rel_path.replace(os.sep, "/")
-
-            for pattern in patterns:
-                pattern = pattern.rstrip("/")
-                if (
-                    fnmatch.fnmatch(rel_posix, pattern)
-                    or fnmatch.fnmatch(rel_posix, f"{pattern}/*")
-                    or fnmatch.fnmatch(os.path.basename(file_path), pattern)
-                ):
-                    return True
         except ValueError:
-            pass
-        return False
+            return False
+        base_name = os.path.basename(file_path)
+        if base_name in literal_names or base_name.endswith(suffixes):
+            return True
+        rel_posix = rel_path.replace(os.sep, "/") if need_sep_replace else rel_path
+        # 字面模式匹配相对路径本身或其下的任意内容，等价于首级目录名相同
+        if rel_posix.partition("/")[0] in literal_names:
+            return True
+        if suffixes and (rel_posix.endswith(suffixes) or any(suffix_dir in rel_posix for suffix_dir in suffix_dirs)):
+            return True
+        if rel_regex is None:
+            return False
+        return bool(rel_regex.match(rel_posix) or base_regex.match(base_name))
 
+    def _is_ignored_dir(name: str) -> bool:
+        """仅按目录名判断，命中时整棵子树可直接剪枝；未命中仍需用完整路径判断"""
+        if name in literal_names or name.endswith(suffixes):
+            return True
+        return base_regex is not None and bool(base_regex.match(name))
+
+    _is_ignored.is_ignored_dir = _is_ignored_dir
     return _is_ignored
 
 
@@ -1609,7 +1920,7 @@ PATCH_PROMPT_HEADER = """
 [symbol path rule end]
 """
 
-DUMB_EXAMPLE_A = (Path(__file__).parent / "prompts/dumb-example").read_text("utf8")
+DUMB_EXAMPLE_A = (_MODULE_DIR / "prompts/dumb-example").read_text("utf8")
 
 DUMB_PROMPT = f"""
 # 输出规范
@@ -1636,46 +1947,76 @@ CHANGE_LOG_HEADER = """
 """
 
 
-def get_patch_prompt_output(patch_require, file_ranges=None, dumb_prompt=""):
-    modified_type = "symbol" if patch_require else "block"
-    prompt = ""
-    if patch_require and dumb_prompt:
-        prompt += dumb_prompt
-    if not dumb_prompt and patch_require:
-        prompt += (
-            f"""
+def _patch_response_format(path_label):
+    """生成响应格式说明，仅在模块加载时调用"""
+    return f"""
 # 响应格式
 {CHANGE_LOG_HEADER}
-[overwrite whole {modified_type}]: 块路径
+[overwrite whole symbol]: {path_label}
 [start]
 完整文件内容
 [end]
 
 或（无修改时）:
-[overwrite whole {modified_type}]: 块路径
+[overwrite whole symbol]: {path_label}
 [start]
 完整原始内容
 [end]
 
 """
-            if file_ranges
-            else f"""
-# 响应格式
-{CHANGE_LOG_HEADER}
-[overwrite whole {modified_type}]: 符号路径
-[start]
-完整文件内容
-[end]
 
-或（无修改时）:
-[overwrite whole {modified_type}]: 符号路径
+
+# 响应格式说明是静态文本，加载时生成一次
+_RESP_SYMBOL = _patch_response_format("符号路径")
+_RESP_BLOCK = _patch_response_format("块路径")
+
+
+def get_patch_prompt_output(patch_require, file_ranges=None, dumb_prompt=""):
+    if not patch_require:
+        return ""
+    if dumb_prompt:
+        return dumb_prompt
+    return _RESP_BLOCK if file_ranges else _RESP_SYMBOL
+
+
+def _get_block_text(patch_dict: dict) -> str:
+    """获取符号代码文本，优先使用已保存的字符串，没有时才解码block_content"""
+    block_text = patch_dict.get("block_text")
+    if block_text is None:
+        block_content = patch_dict["block_content"]
+        block_text = block_content if isinstance(block_content, str) else block_content.decode("utf-8")
+    return block_text
+
+
+_NO_PATCH_HEADER = "现有代码库里的一些符号和代码块:\n"
+
+_SYMBOL_BLOCK_FMT = """
+[SYMBOL START]
+符号名称: {symbol_name}
+文件路径: {file_path}
+
 [start]
-完整原始内容
+{content}
 [end]
 
+[SYMBOL END]
+"""
+
+_FILE_RANGE_RULES = """\
+8. 可以修改任意块，一个或者多个，但必须返回块的完整路径，做为区分
+9. 只输出你修改的那个块
+"""
+
+_FILE_RANGE_FMT = """
+[FILE RANGE START]
+文件路径: {file_path}:{start}-{end}
+
+[CONTENT START]
+{content}
+[CONTENT END]
+
+[FILE RANGE END]
 """
-        )
-    return prompt
 
 
 def generate_patch_prompt(symbol_name, symbol_map, patch_require=False, file_ranges=None):
@@ -1693,52 +2034,44 @@ def generate_patch_prompt(symbol_name, symbol_map, patch_require=False, file_ran
         3. 当patch_require=True时用户会提供具体修改要求
     """
 
-    prompt = ""
+    prompt_parts = []
     if patch_require:
-        text = (Path(__file__).parent / "prompts/symbol-path-rule-v2").read_text("utf8")
-        patch_text = (Path(__file__).parent / "prompts/patch-rule").read_text("utf8")
-        prompt += PATCH_PROMPT_HEADER.format(
-            current_dir=str(Path.cwd()), patch_rule=patch_text, symbol_path_rule_content=text
+        text = (_MODULE_DIR / "prompts/symbol-path-rule-v2").read_text("utf8")
+        patch_text = (_MODULE_DIR / "prompts/patch-rule").read_text("utf8")
+        prompt_parts.append(
+            PATCH_PROMPT_HEADER.format(
+                current_dir=str(Path.cwd()), patch_rule=patch_text, symbol_path_rule_content=text
+            )
         )
-    if not patch_require:
-        prompt += "现有代码库里的一些符号和代码块:\n"
+    else:
+        prompt_parts.append(_NO_PATCH_HEADER)
     # 添加符号信息
     for symbol_name in symbol_name.args:
         patch_dict = symbol_map[symbol_name]
-        prompt += f"""
-[SYMBOL START]
-符号名称: {symbol_name}
-文件路径: {patch_dict["file_path"]}
-
-[start]
-{patch_dict["block_content"] if isinstance(patch_dict["block_content"], str) else patch_dict["block_content"].decode("utf-8")}
-[end]
-
-[SYMBOL END]
-"""
+        prompt_parts.append(
+            _SYMBOL_BLOCK_FMT.format(
+                symbol_name=symbol_name, file_path=patch_dict["file_path"], content=_get_block_text(patch_dict)
+            )
+        )
 
     # 添加文件范围信息
     if patch_require and file_ranges:
-        prompt += """\
-8. 可以修改任意块，一个或者多个，但必须返回块的完整路径，做为区分
-9. 只输出你修改的那个块
-"""
+        prompt_parts.append(_FILE_RANGE_RULES)
         for file_path, range_info in file_ranges.items():
-            prompt += f"""
-[FILE RANGE START]
-文件路径: {file_path}:{range_info["range"][0]}-{range_info["range"][1]}
-
-[CONTENT START]
-{range_info["content"].decode("utf-8") if isinstance(range_info["content"], bytes) else range_info["content"]}
-[CONTENT END]
-
-[FILE RANGE END]
-"""
-    prompt += f"""
+            content = range_info["content"]
+            prompt_parts.append(
+                _FILE_RANGE_FMT.format(
+                    file_path=file_path,
+                    start=range_info["range"][0],
+                    end=range_info["range"][1],
+                    content=content.decode("utf-8") if isinstance(content, bytes) else content,
+                )
+            )
+    prompt_parts.append(f"""
 {get_patch_prompt_output(patch_require, file_ranges, dumb_prompt=DUMB_EXAMPLE_A if not GLOBAL_MODEL_CONFIG.is_thinking else "")}
 {USER_DEMAND}
-"""
-    return prompt
+""")
+    return "".join(prompt_parts)
 
 
 class FormatAndLint:
@@ -1832,6 +2165,9 @@ class FormatAndLint:
         return results
 
 
+_COMMIT_MESSAGE_RE = re.compile(r"\[git commit message start\](.*?)\[git commit message end\]", re.DOTALL)
+
+
 class AutoGitCommit:
     def __init__(
         self,
@@ -1848,8 +2184,7 @@ class AutoGitCommit:
     def _extract_commit_message(self) -> str:
         if self.gpt_response is None:
             return ""
-        pattern = r"\[git commit message start\](.*?)\[git commit message end\]"
-        match = re.search(pattern, self.gpt_response, re.DOTALL)
+        match = _COMMIT_MESSAGE_RE.search(self.gpt_response)
         return match.group(1).strip() if match else ""
 
     def _confirm_message(self) -> bool:
@@ -1886,6 +2221,19 @@ class AutoGitCommit:
             print("提交已取消")
 
 
+# 大模型响应中的符号/代码块，传统格式和 Markdown 代码块格式
+_BLOCK_PATCH_RE = re.compile(
+    r"(\[overwrite whole (symbol|block)\]:\s*([^\n]+)\s*\n\[start\](.*?)\n\[end\]|"
+    r"```([a-zA-Z0-9_]+)?:([^\n`]+)\n(.*?)```)",
+    re.DOTALL,
+)
+_SYMBOL_PATH_RE = re.compile(
+    r"\[overwrite whole symbol\]:\s*([^\n]+)\s*\n\[start\]|"
+    r"```[a-zA-Z0-9_]+?:([^\n`]+)\n",
+    re.DOTALL,
+)
+
+
 class BlockPatchResponse:
     """大模型响应解析器"""
 
@@ -1901,13 +2249,7 @@ class BlockPatchResponse:
         pending_code = []  # 暂存未注册符号的代码片段
 
         # 匹配两种响应格式：传统格式和 Markdown 代码块格式
-        pattern = re.compile(
-            r"(\[overwrite whole (symbol|block)\]:\s*([^\n]+)\s*\n\[start\](.*?)\n\[end\]|"
-            r"```([a-zA-Z0-9_]+)?:([^\n`]+)\n(.*?)```)",
-            re.DOTALL,
-        )
-
-        for match in pattern.finditer(response_text):
+        for match in _BLOCK_PATCH_RE.finditer(response_text):
             # 传统格式处理
             if match.group(1):
                 section_type = match.group(2)
@@ -1948,13 +2290,7 @@ class BlockPatchResponse:
         """
         symbol_paths = {}
         # 匹配传统格式和 Markdown 代码块格式
-        pattern = re.compile(
-            r"\[overwrite whole symbol\]:\s*([^\n]+)\s*\n\[start\]|"
-            r"```[a-zA-Z0-9_]+?:([^\n`]+)\n",
-            re.DOTALL,
-        )
-
-        for match in pattern.finditer(response_text):
+        for match in _SYMBOL_PATH_RE.finditer(response_text):
             if match.group(1):  # 传统格式
                 whole_path = match.group(1).strip()
             else:  # Markdown 格式
@@ -1982,6 +2318,12 @@ def parse_llm_response(response_text, symbol_names=None):
     return parser.parse(response_text)
 
 
+_FILE_CHANGE_RE = re.compile(
+    r"\[overwrite whole (?:symbol|file)\]:\s*(.+?)\n\[start\]\n(.*?)\n\[end\]",
+    re.DOTALL,
+)
+
+
 def process_file_change(response_text, valid_symbols=None):
     """
     解析LLM响应文本，提取文件修改记录
@@ -1997,15 +2339,11 @@ def process_file_change(response_text, valid_symbols=None):
     if valid_symbols is None:
         valid_symbols = []
 
-    pattern = re.compile(
-        r"\[overwrite whole (?:symbol|file)\]:\s*(.+?)\n\[start\]\n(.*?)\n\[end\]",
-        re.DOTALL,
-    )
     results = []
     remaining_parts = []
     last_end = 0
 
-    for match in pattern.finditer(response_text):
+    for match in _FILE_CHANGE_RE.finditer(response_text):
         start, end = match.start(), match.end()
         symbol_path = match.group(1).strip()
         content = response_text[start:end]
@@ -2032,11 +2370,8 @@ def process_file_change(response_text, valid_symbols=None):
 
 
 def lookup_symbols(file, symbol_names):
-    from tree import ParserLoader as PL
-    from tree import ParserUtil as PU
-
-    parser_loader_s = PL()
-    parser_util = PU(parser_loader_s)
+    parser_loader_s = ParserLoader()
+    parser_util = ParserUtil(parser_loader_s)
     return parser_util.lookup_symbols(file, symbol_names)
 
 
@@ -2116,6 +2451,10 @@ def add_symbol_details(remaining, symbol_detail):
             }
 
 
+# 拆开书写，避免标签本身被当作思考内容处理
+_THINK_STRIP_RE = re.compile("<thi" + "nk>.*?</thi" + "nk>", re.DOTALL)
+
+
 def process_patch_response(
     response_text,
     symbol_detail,
@@ -2129,13 +2468,7 @@ def process_patch_response(
 ):
     """处理大模型的补丁响应，生成差异并应用补丁"""
     # 处理响应文本
-    prevent_escape = ("<thi" + "nk>", "</thi" + "nk>")
-    filtered_response = re.sub(
-        rf"{prevent_escape[0]}.*?{prevent_escape[1]}",
-        "",
-        response_text,
-        flags=re.DOTALL,
-    ).strip()
+    filtered_response = _THINK_STRIP_RE.sub("", response_text).strip()
     if not ignore_new_symbol:
         add_symbol_details(filtered_response, symbol_detail)
     if not no_mix:
@@ -2327,8 +2660,9 @@ class DiffBlockFilter:
 def test_patch_response():
     """测试补丁响应处理功能"""
     # 读取前面生成的测试文件
-    with open("diff_test.json", "rb") as f:
-        args = marshal.load(f)
+    # 直接从内存映射反序列化，不再经过文件对象逐段读取
+    with open("diff_test.json", "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        args = marshal.loads(mm)
 
     process_patch_response(*args)
 
@@ -2352,14 +2686,11 @@ def find_nearest_newline(position: int, content: str, direction: str = "forward"
     if direction not in ("forward", "backward"):
         raise ValueError("Invalid direction, must be 'forward' or 'backward'")
 
-    max_pos = len(content) - 1
-    step = 1 if direction == "forward" else -1
-    end = max_pos + 1 if direction == "forward" else -1
-
-    for i in range(position, end, step):
-        if content[i] == "\n":
-            return i
-    return position
+    if direction == "forward":
+        index = content.find("\n", position)
+    else:
+        index = content.rfind("\n", 0, position + 1)
+    return index if index != -1 else position
 
 
 def move_forward_from_position(current_pos: int, content: str) -> int:
@@ -2379,8 +2710,12 @@ def move_forward_from_position(current_pos: int, content: str) -> int:
     if current_pos >= len(content):
         return current_pos
 
-    newline_pos = find_nearest_newline(current_pos, content, "forward")
-    return newline_pos + 1 if newline_pos != current_pos else len(content)
+    newline_pos = content.find("\n", current_pos)
+    return newline_pos + 1 if newline_pos != -1 else len(content)
+
+
+# 并发请求符号服务的线程数上限
+_SYMBOL_FETCH_WORKERS = 8
 
 
 def patch_symbol_with_prompt(symbol_names: CmdNode):
@@ -2393,8 +2728,13 @@ def patch_symbol_with_prompt(symbol_names: CmdNode):
         符号对应的纯文本内容
     """
     symbol_map = {}
-    for symbol_name in symbol_names.args:
-        symbol_result = get_symbol_detail(symbol_name)
+    if len(symbol_names.args) > 1:
+        # 符号服务请求相互独立，并发发出，结果仍按参数顺序处理
+        with ThreadPoolExecutor(max_workers=min(_SYMBOL_FETCH_WORKERS, len(symbol_names.args))) as executor:
+            symbol_results = list(executor.map(get_symbol_detail, symbol_names.args))
+    else:
+        symbol_results = [get_symbol_detail(symbol_name) for symbol_name in symbol_names.args]
+    for symbol_name, symbol_result in zip(symbol_names.args, symbol_results):
         if len(symbol_result) == 1:
             symbol_name = symbol_result[0].get("symbol_name", symbol_name)
             symbol_map[symbol_name] = symbol_result[0]
@@ -2434,8 +2774,9 @@ def get_symbol_detail(symbol_names: str) -> list:
     symbol_names = f"{relative_path}/{symbol}"
     symbol_list = _parse_symbol_names(symbol_names)
     api_url = os.getenv("GPT_SYMBOL_API_URL", "http://127.0.0.1:9050")
-    batch_response = send_http_request(_build_api_url(api_url, symbol_names))
-    if GPT_FLAGS.get(GPT_FLAG_CONTEXT):
+    lsp_enabled = GPT_FLAGS.get(GPT_FLAG_CONTEXT)
+    batch_response = send_http_request(_build_api_url(api_url, symbol_names, lsp_enabled))
+    if lsp_enabled:
         return [_process_symbol_data(symbol_data, "") for _, symbol_data in enumerate(batch_response)]
     return [_process_symbol_data(symbol_data, symbol_list[idx]) for idx, symbol_data in enumerate(batch_response)]
 
@@ -2456,10 +2797,9 @@ def _parse_symbol_names(symbol_names: str) -> list:
     return [symbol_names]
 
 
-def _build_api_url(api_url: str, symbol_names: str) -> str:
-    """构造批量请求的API URL"""
+def _build_api_url(api_url: str, symbol_names: str, lsp_enabled: bool) -> str:
+    """构造批量请求的API URL，lsp_enabled由调用方读取一次后传入"""
     encoded_symbols = requests.utils.quote(symbol_names, safe="")
-    lsp_enabled = GPT_FLAGS.get(GPT_FLAG_CONTEXT)
     return f"{api_url}/symbol_content?symbol_path=symbol:{encoded_symbols}&json_format=true&lsp_enabled={lsp_enabled}"
 
 
@@ -2485,6 +2825,8 @@ def _process_symbol_data(symbol_data: dict, symbol_name: str) -> dict:
         ),
         "block_range": location["block_range"],
         "block_content": symbol_data["content"].encode("utf-8"),
+        # 保留服务返回的原始字符串，生成提示词时无需再解码
+        "block_text": symbol_data["content"],
     }
 
 
@@ -2504,11 +2846,10 @@ def send_http_request(url, is_plain_text=False):
         url: 请求的URL
         is_plain_text: 是否返回纯文本内容，默认为False返回JSON
     """
-    with ProxyEnvDisable():
-        response = requests.get(url, proxies={"http": None, "https": None}, timeout=30)
-        response.raise_for_status()
+    response = _get_fetch_session().get(url, timeout=30)
+    response.raise_for_status()
 
-    return response.text if is_plain_text else response.json()
+    return response.text if is_plain_text else _json_loads(response.content)
 
 
 def query_symbol(symbol_name):
@@ -2587,6 +2928,18 @@ class ProjectSections:
     # 可以根据需要扩展更多字段
 
 
+_PROJECT_SECTION_RE = re.compile(r"\[(\w+)_START\](.*?)\[\1_END\]", re.DOTALL)
+_PROJECT_REQUIRED_FIELDS = frozenset(
+    {
+        "project_design",
+        "readme",
+        "dir_tree",
+        "setup_script",
+        "api_description",
+    }
+)
+
+
 def parse_project_text(text: str) -> ProjectSections:
     """
     从输入文本中提取结构化项目数据
@@ -2597,24 +2950,16 @@ def parse_project_text(text: str) -> ProjectSections:
     返回：
     ProjectSections对象，可通过成员访问各字段内容
     """
-    pattern = r"[(\w+)_START\](.*?)\[\1_END\]"
-    matches = re.findall(pattern, text, re.DOTALL)
-
     section_dict = {}
-    for name, content in matches:
-        key = name.lower()
-        section_dict[key] = content.strip()
+    for match in _PROJECT_SECTION_RE.finditer(text):
+        section_dict[match.group(1).lower()] = match.group(2).strip()
+        # 必要字段已齐全时不再继续扫描剩余文本
+        if _PROJECT_REQUIRED_FIELDS <= section_dict.keys():
+            break
 
     # 验证必要字段
-    required_fields = {
-        "project_design",
-        "readme",
-        "dir_tree",
-        "setup_script",
-        "api_description",
-    }
-    if not required_fields.issubset(section_dict.keys()):
-        missing = required_fields - section_dict.keys()
+    if not _PROJECT_REQUIRED_FIELDS.issubset(section_dict.keys()):
+        missing = _PROJECT_REQUIRED_FIELDS - section_dict.keys()
         raise ValueError(f"缺少必要字段: {', '.join(missing)}")
 
     return ProjectSections(**section_dict)
@@ -2622,6 +2967,9 @@ def parse_project_text(text: str) -> ProjectSections:
 
 # 定义正则表达式常量
 CMD_PATTERN = r"(?<!\\)@[^ \u3000]+"
+_CMD_RE = re.compile(CMD_PATTERN)
+# ..symbol.. 形式的符号引用
+_SYMBOL_REF_RE = re.compile(r"\.\.(.*?)\.\.")
 
 
 class GPTContextProcessor:
@@ -2671,25 +3019,32 @@ class GPTContextProcessor:
         result = []
         cmd_groups = defaultdict(list)
 
-        # 提取符号节点
-        symbol_matches = re.findall(r"\.\.(.*?)\.\.", text)
-        text = re.sub(r"\.\.(.*?)\.\.", r"\1", text)
-        symbol_node = SearchSymbolNode(symbols=symbol_matches)
+        # 提取符号节点，收集符号的同时去掉两侧的..，只扫描一遍
+        symbol_matches = []
+
+        def _collect_symbol(match):
+            symbol_matches.append(match.group(1))
+            return match.group(1)
 
-        # 提取命令节点
-        commands = re.findall(CMD_PATTERN, text)
-        text_parts = re.split(CMD_PATTERN, text)
+        text = _SYMBOL_REF_RE.sub(_collect_symbol, text)
+        symbol_node = SearchSymbolNode(symbols=symbol_matches)
 
-        for i, part in enumerate(text_parts):
+        # 提取命令节点，一次finditer同时得到命令和命令之间的文本
+        last_end = 0
+        for match in _CMD_RE.finditer(text):
+            part = text[last_end : match.start()]
             if part:
                 result.append(TextNode(content=part.replace("\\@", "@")))
-            if i < len(commands):
-                cmd = commands[i].lstrip("@")
-                if ":" in cmd and not cmd.startswith("http"):
-                    symbol, _, arg = cmd.partition(":")
-                    cmd_groups[symbol].append(arg)
-                else:
-                    result.append(CmdNode(command=cmd.strip()))
+            last_end = match.end()
+            cmd = match.group(0).lstrip("@")
+            if ":" in cmd and not cmd.startswith("http"):
+                symbol, _, arg = cmd.partition(":")
+                cmd_groups[symbol].append(arg)
+            else:
+                result.append(CmdNode(command=cmd.strip()))
+        part = text[last_end:]
+        if part:
+            result.append(TextNode(content=part.replace("\\@", "@")))
 
         # 处理带参数的命令
         if cmd_groups:
@@ -2810,6 +3165,7 @@ class PatchPromptBuilder:
                 "symbol_name": symbol["name"],
                 "file_path": symbol["file_path"],
                 "block_content": symbol["code"].encode("utf8"),
+                "block_text": symbol["code"],
                 "code_range": (
                     (symbol["start_line"], symbol.get("start_col", 0)),
                     (symbol["end_line"], symbol.get("end_col", 0)),
@@ -2893,38 +3249,42 @@ class PatchPromptBuilder:
 
     def _build_symbol_prompt(self) -> str:
         """构建符号部分的prompt"""
-        prompt = ""
+        prompt_parts = []
+        prompt_len = 0
         if not self.use_patch:
-            prompt += "现有代码库里的一些符号和代码块:\n"
+            prompt_parts.append("现有代码库里的一些符号和代码块:\n")
+            prompt_len += len(prompt_parts[-1])
 
         for symbol_name, patch_dict in self.symbol_map.items():
-            prompt += f"""
+            prompt_parts.append(f"""
 [SYMBOL START]
 符号名称: {symbol_name}
 文件路径: {patch_dict["file_path"]}
 
 [start]
-{patch_dict["block_content"] if isinstance(patch_dict["block_content"], str) else patch_dict["block_content"].decode("utf-8")}
+{_get_block_text(patch_dict)}
 [end]
 
 [SYMBOL END]
-"""
-            self.tokens_left -= len(prompt)
+""")
+            # 按累计长度扣减剩余额度
+            prompt_len += len(prompt_parts[-1])
+            self.tokens_left -= prompt_len
             if self.tokens_left < 0:
                 print("警告: 符号提示内容过长，已截断")
                 break
-        return prompt
+        return "".join(prompt_parts)
 
     def _build_file_range_prompt(self) -> str:
         """构建文件范围部分的prompt"""
-        prompt = ""
+        prompt_parts = []
         if self.use_patch and self.file_ranges:
-            prompt += """\
+            prompt_parts.append("""\
 - 可以修改任意块，一个或者多个，但必须返回块的完整路径，做为区分
 - 只输出你修改的那个块
-"""
+""")
             for file_path, range_info in self.file_ranges.items():
-                prompt += f"""
+                prompt_parts.append(f"""
 [FILE RANGE START]
 文件路径: {file_path}:{range_info["range"][0]}-{range_info["range"][1]}
 
@@ -2933,8 +3293,8 @@ class PatchPromptBuilder:
 [CONTENT END]
 
 [FILE RANGE END]
-"""
-        return prompt
+""")
+        return "".join(prompt_parts)
 
     def build(self, user_requirement: str = None) -> str:
         """构建完整的prompt"""
@@ -2943,8 +3303,8 @@ class PatchPromptBuilder:
 
         prompt = ""
         if self.use_patch:
-            text = (Path(__file__).parent / "prompts/symbol-path-rule-v2").read_text("utf8")
-            patch_text = (Path(__file__).parent / "prompts/patch-rule").read_text("utf8")
+            text = (_MODULE_DIR / "prompts/symbol-path-rule-v2").read_text("utf8")
+            patch_text = (_MODULE_DIR / "prompts/patch-rule").read_text("utf8")
             prompt += PATCH_PROMPT_HEADER.format(
                 current_dir=str(Path.cwd()), patch_rule=patch_text, symbol_path_rule_content=text
             )
@@ -3024,15 +3384,16 @@ def is_prompt_file(match):
 def is_local_file(match):
     """判断是否为本地文件"""
     # 如果匹配包含行号范围（如:10-20），先去掉行号部分再判断
-    if re.search(r":(\d+)?-(\d+)?$", match):
-        match = re.sub(r":(\d+)?-(\d+)?$", "", match)
+    line_range_match = _LINE_RANGE_RE.search(match)
+    if line_range_match:
+        match = match[: line_range_match.start()]
 
     # 检查是否是通配符路径
     if "*" in match or "?" in match:
-        expanded = os.path.expanduser(match)
+        expanded = _expand_home(match)
         return len(glob.glob(expanded)) > 0
 
-    return os.path.exists(os.path.expanduser(match))
+    return os.path.exists(_expand_home(match))
 
 
 def is_url(match):
@@ -3048,7 +3409,7 @@ def handle_processing_error(match, error):
 
 
 # 获取.shadowroot的绝对路径，支持~展开
-shadowroot = Path(__file__).parent / ".shadowroot"
+shadowroot = _MODULE_DIR / ".shadowroot"
 
 
 def _save_response_content(content):
@@ -3060,20 +3421,25 @@ def _save_response_content(content):
     return response_path
 
 
+# 统一的正则表达式模式，匹配所有可能的格式
+_FILE_MATCH_RE = re.compile(
+    r"(\[project setup shellscript start\]\n(.*?)\n\[project setup shellscript end\]|"
+    r"\[user verify script start\]\n(.*?)\n\[user verify script end\]|"
+    r"\[(overwrite whole|created) file\]: (.*?)\n\[start\]\n(.*?)\n\[end\]|"
+    r"```(\w+):([^\[\n]+)\n(.*?)\n```|"
+    r"```\w*\n\[(?:overwrite whole|created) file\]:\s+([^\n]+)\n(.*?)\n```|"
+    r"```\w*:\[(?:overwrite whole|created) file\]:\s+([^\n]+)\n(.*?)\n```|"
+    r"```(\w*)\n(.*?)\n```)",  # 新增：通用Markdown代码块模式
+    re.DOTALL,
+)
+_START_END_TAG_RE = re.compile(r"^\[start\]\n?|\n?\[end\]$")
+_FILE_COMMENT_RE = re.compile(r"#\s*file:\s*(\S+)")
+
+
 def _extract_file_matches(content):
     """从内容中提取文件匹配项，支持多种格式"""
-    # 统一的正则表达式模式，匹配所有可能的格式
-    pattern = (
-        r"(\[project setup shellscript start\]\n(.*?)\n\[project setup shellscript end\]|"
-        r"\[user verify script start\]\n(.*?)\n\[user verify script end\]|"
-        r"\[(overwrite whole|created) file\]: (.*?)\n\[start\]\n(.*?)\n\[end\]|"
-        r"```(\w+):([^\[\n]+)\n(.*?)\n```|"
-        r"```\w*\n\[(?:overwrite whole|created) file\]:\s+([^\n]+)\n(.*?)\n```|"
-        r"```\w*:\[(?:overwrite whole|created) file\]:\s+([^\n]+)\n(.*?)\n```|"
-        r"```(\w*)\n(.*?)\n```)"  # 新增：通用Markdown代码块模式
-    )
     matches = []
-    for match in re.finditer(pattern, content, re.DOTALL):
+    for match in _FILE_MATCH_RE.finditer(content):
         # 处理项目设置脚本
         if match.group(1) and match.group(1).startswith("[project setup"):
             matches.append(("project_setup_script", match.group(2).strip(), ""))
@@ -3094,7 +3460,7 @@ def _extract_file_matches(content):
             file_path = match.group(8).strip()
             file_content = match.group(9).strip()
             # Remove [start] and [end] tags if they exist
-            file_content = re.sub(r"^\[start\]\n?|\n?\[end\]$", "", file_content).strip()
+            file_content = _START_END_TAG_RE.sub("", file_content).strip()
             matches.append(("overwrite_whole_file", file_content, file_path))
 
         # 处理标题+Markdown代码块格式 (#### 4. 更新CSS样式)
@@ -3102,7 +3468,7 @@ def _extract_file_matches(content):
             file_path = match.group(10).strip()
             file_content = match.group(11).strip()
             # Remove [start] and [end] tags if they exist
-            file_content = re.sub(r"^\[start\]\n?|\n?\[end\]$", "", file_content).strip()
+            file_content = _START_END_TAG_RE.sub("", file_content).strip()
             matches.append(("overwrite_whole_file", file_content, file_path))
 
         # 处理 markdown:[overwrite whole file]: 格式
@@ -3110,7 +3476,7 @@ def _extract_file_matches(content):
             file_path = match.group(12).strip()
             file_content = match.group(13).strip()
             # Remove [start] and [end] tags if they exist
-            file_content = re.sub(r"^\[start\]\n?|\n?\[end\]$", "", file_content).strip()
+            file_content = _START_END_TAG_RE.sub("", file_content).strip()
             matches.append(("overwrite_whole_file", file_content, file_path))
 
         # 新增：处理通用Markdown代码块（第一行包含文件注释）
@@ -3118,7 +3484,7 @@ def _extract_file_matches(content):
             code_content = match.group(15).strip()
             # 尝试从第一行提取文件路径
             first_line, _, rest = code_content.partition("\n")
-            file_path_match = re.search(r"#\s*file:\s*(\S+)", first_line)
+            file_path_match = _FILE_COMMENT_RE.search(first_line)
             if file_path_match:
                 file_path = file_path_match.group(1)
                 file_content = rest
@@ -3135,11 +3501,16 @@ def _process_file_path(file_path):
     return file_path
 
 
-def _save_file_to_shadowroot(shadow_file_path, file_content):
-    """将文件内容保存到shadowroot目录"""
+def _write_shadow_file(shadow_file_path, file_content):
+    """将文件内容写入shadowroot目录，不输出提示，可在工作线程中调用"""
     shadow_file_path.parent.mkdir(parents=True, exist_ok=True)
     with open(shadow_file_path, "w", encoding="utf-8") as f:
         f.write(file_content)
+
+
+def _save_file_to_shadowroot(shadow_file_path, file_content):
+    """将文件内容保存到shadowroot目录"""
+    _write_shadow_file(shadow_file_path, file_content)
     print(f"已保存文件到: {shadow_file_path}")
 
 
@@ -3225,6 +3596,29 @@ def _apply_patch(diff_file):
         print(f"应用变更失败: {e}")
 
 
+# 并发生成diff的线程数上限
+_DIFF_WORKERS = 8
+
+
+def _diff_matched_file(filename, file_content):
+    """将单个文件的新内容写入shadowroot，并生成与原文件的diff
+
+    会在工作线程中执行，不直接输出，返回(shadow文件路径, diff)由调用方按顺序打印
+    """
+    file_path = Path(filename).absolute()
+    old_file_path = file_path
+    if not old_file_path.exists():
+        old_file_path.parent.mkdir(parents=True, exist_ok=True)
+        old_file_path.touch()
+    file_path = _process_file_path(file_path)
+    shadow_file_path = shadowroot / file_path
+    _write_shadow_file(shadow_file_path, file_content)
+    original_content = ""
+    with open(str(old_file_path), "r", encoding="utf8") as f:
+        original_content = f.read()
+    return shadow_file_path, _generate_unified_diff(old_file_path, shadow_file_path, original_content, file_content)
+
+
 def extract_and_diff_files(content, auto_apply=False, save=True):
     """从内容中提取文件并生成diff"""
     if save:
@@ -3261,26 +3655,25 @@ def extract_and_diff_files(content, auto_apply=False, save=True):
     _process_script(setup_script, "project_setup.sh")
     _process_script(verify_script, "user_verify.sh")
 
-    diff_content = ""
-    for filename, file_content in file_matches:
-        file_path = Path(filename).absolute()
-        old_file_path = file_path
-        if not old_file_path.exists():
-            old_file_path.parent.mkdir(parents=True, exist_ok=True)
-            old_file_path.touch()
-        file_path = _process_file_path(file_path)
-        shadow_file_path = shadowroot / file_path
-        _save_file_to_shadowroot(shadow_file_path, file_content)
-        original_content = ""
-        with open(str(old_file_path), "r", encoding="utf8") as f:
-            original_content = f.read()
-        diff = _generate_unified_diff(old_file_path, shadow_file_path, original_content, file_content)
-        diff_content += diff + "\n\n"
+    # 各文件的读写和diff子进程互不依赖，可以并发执行；同一文件出现多次时按顺序处理，保证后写入的内容生效
+    # 按规范化后的绝对路径判断是否重复，a.txt与./a.txt视为同一文件
+    unique_files = {os.path.abspath(filename) for filename, _ in file_matches}
+    if len(file_matches) > 1 and len(unique_files) == len(file_matches):
+        with ThreadPoolExecutor(max_workers=min(_DIFF_WORKERS, len(file_matches))) as executor:
+            results = list(executor.map(lambda item: _diff_matched_file(*item), file_matches))
+    else:
+        results = [_diff_matched_file(filename, file_content) for filename, file_content in file_matches]
+    for shadow_file_path, _ in results:
+        print(f"已保存文件到: {shadow_file_path}")
+    diff_content = "".join(diff + "\n\n" for _, diff in results)
     diff_file = _save_diff_content(diff_content)
     if diff_file:
         display_and_apply_diff(diff_file, auto_apply=auto_apply)
 
 
+_THINK_BLOCK_STRIP_RE = re.compile(r"<th" + r"ink>\n?.*?\n?</th" + r"ink>\n*", re.DOTALL)
+
+
 def process_response(prompt, response_data, file_path, save=True, obsidian_doc=None, ask_param=None):
     """处理API响应并保存结果"""
     if not response_data["choices"]:
@@ -3293,7 +3686,7 @@ def process_response(prompt, response_data, file_path, save=True, obsidian_doc=N
     if save and file_path:
         with open(file_path, "w+", encoding="utf8") as f:
             # 删除内容
-            cleaned_content = re.sub(r"<th" + r"ink>\n?.*?\n?</th" + r"ink>\n*", "", content, flags=re.DOTALL)
+            cleaned_content = _THINK_BLOCK_STRIP_RE.sub("", content)
             f.write(cleaned_content.strip())
 
     with tempfile.NamedTemporaryFile(mode="w", suffix=".md", encoding="utf-8", delete=False) as tmp_file:
@@ -3324,6 +3717,11 @@ def process_response(prompt, response_data, file_path, save=True, obsidian_doc=N
         process_patch_response(content, GPT_VALUE_STORAGE[GPT_SYMBOL_PATCH], relative_to_root=True)
 
 
+_OBSIDIAN_THINK_RE = re.compile(r"<think>\n*([\s\S]*?)\n*</think>", re.DOTALL)
+# 链接名只需去掉花括号，translate比正则替换更直接
+_BRACE_TRANS = str.maketrans("", "", "{}")
+
+
 def save_to_obsidian(obsidian_doc, content, prompt=None, ask_param=None):
     """将内容保存到Obsidian文档系统
 
@@ -3346,13 +3744,11 @@ def save_to_obsidian(obsidian_doc, content, prompt=None, ask_param=None):
     obsidian_file = month_dir / timestamp
 
     # 格式化内容：将非空思维过程渲染为绿色，去除背景色
-    formatted_content = re.sub(
-        r"<think>\n*([\s\S]*?)\n*</think>",
+    formatted_content = _OBSIDIAN_THINK_RE.sub(
         lambda match: '<div style="color: #228B22; padding: 10px; border-radius: 5px; margin: 10px 0;">'
         + match.group(1).replace("\n", "<br>")
         + "</div>",
         content,
-        flags=re.DOTALL,
     )
 
     # 添加提示词
@@ -3365,11 +3761,60 @@ def save_to_obsidian(obsidian_doc, content, prompt=None, ask_param=None):
 
     # 更新main.md
     main_file = obsidian_dir / f"{now.tm_year}-{now.tm_mon}-{now.tm_mday}-索引.md"
-    link_name = re.sub(r"[{}]", "", ask_param[:256]) if ask_param else timestamp
+    link_name = ask_param[:256].translate(_BRACE_TRANS) if ask_param else timestamp
     link = f"[[{month_dir.name}/{timestamp}|{link_name}]]\n"
 
-    with open(main_file, "a", encoding="utf-8") as f:
-        f.write(link)
+    _OBSIDIAN_INDEX_WRITER.append(main_file, link)
+
+
+class _ObsidianIndexWriter:
+    """复用索引文件的追加句柄，避免每次保存都重新打开文件
+
+    每条链接写入后立即flush，其他进程和Obsidian能马上看到；日期变化换文件时关闭旧句柄，
+    文件被删除或重写替换(inode变化)时重新打开，避免继续写入已解除链接的旧文件。
+    每次追加仍有一次os.stat和一次flush，节省的只是每次保存的open/close，并非批量缓冲写入
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path = None
+        self._file = None
+        self._file_id = None
+        atexit.register(self.close)
+
+    def append(self, main_file, link: str) -> None:
+        with self._lock:
+            path = str(main_file)
+            if self._file is None or self._path != path or self._file_replaced(path):
+                self._close_file()
+                # 句柄需跨多次保存保持打开，由close()关闭，进程退出时经atexit调用
+                self._file = open(path, "a", encoding="utf-8")  # noqa: SIM115
+                self._path = path
+                stat = os.fstat(self._file.fileno())
+                self._file_id = (stat.st_dev, stat.st_ino)
+            self._file.write(link)
+            self._file.flush()
+
+    def _file_replaced(self, path: str) -> bool:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_dev, stat.st_ino) != self._file_id
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_file()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._path = None
+        self._file_id = None
+
+
+_OBSIDIAN_INDEX_WRITER = _ObsidianIndexWriter()
 
 
 def validate_files(program_args):
@@ -3397,16 +3842,17 @@ def print_proxy_info(proxies, proxy_sources):
 def handle_ask_mode(program_args, proxies):
     """处理--ask模式"""
     program_args.ask = program_args.ask.replace("@symbol_", "@symbol:")
+    model_key = os.environ["GPT_MODEL_KEY"]
     model_switch = ModelSwitch()
-    model_switch.select(os.environ["GPT_MODEL_KEY"])
+    model_switch.select(model_key)
     context_processor = GPTContextProcessor()
     text = context_processor.process_text(program_args.ask)
     print(text)
-    response_data = model_switch.query(os.environ["GPT_MODEL_KEY"], text, proxies=proxies)
+    response_data = model_switch.query(model_key, text, proxies=proxies)
     process_response(
         text,
         response_data,
-        os.path.join(os.path.dirname(__file__), ".lastgptanswer"),
+        os.path.join(_MODULE_DIR, ".lastgptanswer"),
         save=True,
         obsidian_doc=program_args.obsidian_doc,
         ask_param=program_args.ask,
@@ -3492,15 +3938,13 @@ def query_symbol_service(results: FileSearchResults, max_context_size: int) -> d
         api_server = api_server[:-1]
     api_url = f"{api_server}/search-to-symbols?max_context_size={max_context_size}"
     try:
-        with ProxyEnvDisable():
-            response = requests.post(
-                api_url,
-                proxies={"http": None, "https": None},
-                data=results.to_json(),
-                headers={"Content-Type": "application/json"},
-                timeout=10,
-            )
-            return response.json()["results"]
+        response = _get_fetch_session().post(
+            api_url,
+            data=results.to_json(),
+            headers={"Content-Type": "application/json"},
+            timeout=10,
+        )
+        return _json_loads(response.content)["results"]
     except requests.exceptions.RequestException as e:
         print(f"API请求失败: {str(e)}")
     except json.JSONDecodeError:
@@ -3510,42 +3954,6 @@ def query_symbol_service(results: FileSearchResults, max_context_size: int) -> d
     return None
 
 
-class ProxyEnvDisable:
-    """
-    资源管理器用于临时禁用代理环境变量
-
-    进入上下文时移除所有代理相关环境变量，退出时恢复原始值
-    处理变量：http_proxy, https_proxy, ftp_proxy及其大写形式
-    """
-
-    PROXY_VARS = {
-        "all_proxy",
-        "http_proxy",
-        "https_proxy",
-        "ftp_proxy",
-        "ALL_PROXY",
-        "HTTP_PROXY",
-        "HTTPS_PROXY",
-        "FTP_PROXY",
-    }
-
-    def __init__(self):
-        self.original_proxies = {}
-        for var in self.PROXY_VARS:
-            self.original_proxies[var] = os.environ.get(var)
-
-    def __enter__(self):
-        for var in self.PROXY_VARS:
-            os.environ.pop(var, None)
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        for var, value in self.original_proxies.items():
-            if value is not None:
-                os.environ[var] = value
-            else:
-                os.environ.pop(var, None)
-
-
 class ModelSwitch:
     """
     根据模型名称自动切换配置并调用API查询
@@ -3612,7 +4020,7 @@ class ModelSwitch:
 
     def _load_config(self, default_path: str = "model.json") -> dict[str, ModelConfig]:
         """加载模型配置文件并转换为ModelConfig字典"""
-        config_path = self._config_path or os.path.join(os.path.dirname(__file__), default_path)
+        config_path = self._config_path or os.path.join(_MODULE_DIR, default_path)
 
         try:
             with open(config_path, "r") as f:
@@ -3685,9 +4093,7 @@ class ModelSwitch:
 
         # 处理提示词
         text = context_processor.process_text(prompt, tokens_left=architect_config.max_context_size or 32 * 1024)
-        architect_prompt = Path(os.path.join(os.path.dirname(__file__), "prompts/architect")).read_text(
-            encoding="utf-8"
-        )
+        architect_prompt = (_MODULE_DIR / "prompts/architect").read_text(encoding="utf-8")
         architect_prompt += f"\n{text}"
 
         # 获取架构师响应
@@ -3698,7 +4104,7 @@ class ModelSwitch:
         results = []
         if not architect_only:
             coder_config = self._get_model_config(coder_model)
-            coder_prompt = Path(os.path.join(os.path.dirname(__file__), "prompts/coder")).read_text(encoding="utf-8")
+            coder_prompt = (_MODULE_DIR / "prompts/coder").read_text(encoding="utf-8")
 
             for job in parsed["jobs"]:
                 results.append(self._process_coder_job(job, coder_model, coder_config, coder_prompt, prompt))
@@ -3780,7 +4186,7 @@ class ModelSwitch:
             缓存文件保存在"prompt_cache"目录中，格式为"时间戳_CRC32.json"
         """
         """根据模型名称查询API并返回文本结果，支持缓存功能"""
-        cache_dir = os.path.join(os.path.dirname(__file__), "prompt_cache")
+        cache_dir = os.path.join(_MODULE_DIR, "prompt_cache")
         os.makedirs(cache_dir, exist_ok=True)
         # 计算prompt的CRC32
         prompt_crc32 = zlib.crc32(prompt.encode("utf-8")) & 0xFFFFFFFF
@@ -3860,7 +4266,7 @@ class ModelSwitch:
         if hasattr(self, "_prompt_cache") and self._prompt_cache:
             return self._format_cache_info(self._prompt_cache)
 
-        cache_dir = os.path.join(os.path.dirname(__file__), "prompt_cache")
+        cache_dir = os.path.join(_MODULE_DIR, "prompt_cache")
         if not os.path.exists(cache_dir):
             return []
 
@@ -3949,7 +4355,7 @@ def handle_workflow(program_args):
 
 
 def import_relative(module):
-    parent = os.path.dirname(__file__)
+    parent = str(_MODULE_DIR)
     if parent not in sys.path:
         sys.path.insert(0, parent)
     return __import__(module)
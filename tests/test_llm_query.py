@@ -38,6 +38,7 @@ from llm_query import (
     _fetch_symbol_data,
     _find_gitignore,
     _handle_local_file,
+    _parse_gitignore,
     get_symbol_detail,
     interactive_symbol_location,
     process_file_change,
@@ -715,6 +716,240 @@ class TestGitignoreFunctions(unittest.TestCase):
         self.assertEqual(found, parent_gitignore)
         os.remove(parent_gitignore)
 
+    def test_parse_gitignore_reloads_on_change(self):
+        """测试.gitignore缓存在文件修改后失效"""
+        with open(self.gitignore_path, "w", encoding="utf8") as f:
+            f.write("*.tmp\n")
+        is_ignored = _parse_gitignore(self.gitignore_path, self.root)
+        self.assertTrue(is_ignored(os.path.join(self.root, "a.tmp")))
+        self.assertFalse(is_ignored(os.path.join(self.root, "a.log")))
+        self.assertIs(_parse_gitignore(self.gitignore_path, self.root), is_ignored)
+
+        with open(self.gitignore_path, "w", encoding="utf8") as f:
+            f.write("*.log\n")
+        stat = os.stat(self.gitignore_path)
+        os.utime(self.gitignore_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        is_ignored = _parse_gitignore(self.gitignore_path, self.root)
+        self.assertFalse(is_ignored(os.path.join(self.root, "a.tmp")))
+        self.assertTrue(is_ignored(os.path.join(self.root, "a.log")))
+
+    def test_is_ignored_dir_by_name(self):
+        """测试按目录名剪枝的判断"""
+        with open(self.gitignore_path, "w", encoding="utf8") as f:
+            f.write("logs/\ndocs/build\n")
+        is_ignored = _parse_gitignore(self.gitignore_path, self.root)
+        self.assertTrue(is_ignored.is_ignored_dir("node_modules"))
+        self.assertTrue(is_ignored.is_ignored_dir(".git"))
+        self.assertTrue(is_ignored.is_ignored_dir("logs"))
+        self.assertFalse(is_ignored.is_ignored_dir("src"))
+        # 含路径的模式只能用完整路径判断
+        self.assertFalse(is_ignored.is_ignored_dir("build_tools"))
+        self.assertTrue(is_ignored(os.path.join(self.root, "docs", "build")))
+
+
+class TestConversationIndex(unittest.TestCase):
+    """测试对话索引的追加日志与压缩"""
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        conv_dir = Path(self.test_dir.name) / "conversation"
+        self.patchers = [
+            patch.object(llm_query, "INDEX_PATH", conv_dir / "index.json"),
+            patch.object(llm_query, "INDEX_LOG_PATH", conv_dir / "index.log"),
+            patch.object(llm_query, "_CONV_DIR", conv_dir),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.test_dir.cleanup()
+
+    def test_new_conversation_appends_and_compacts(self):
+        first = llm_query.new_conversation("uuid-a")
+        self.assertTrue(llm_query.INDEX_LOG_PATH.exists())
+        self.assertFalse(llm_query.INDEX_PATH.exists())
+        self.assertEqual(llm_query.get_conversation("uuid-a"), Path(first))
+
+        with patch.object(llm_query, "_INDEX_LOG_COMPACT_THRESHOLD", 2):
+            second = llm_query.new_conversation("uuid-b")
+            index = llm_query._load_index()
+        self.assertEqual(index, {"uuid-a": first, "uuid-b": second})
+        self.assertFalse(llm_query.INDEX_LOG_PATH.exists())
+        with open(llm_query.INDEX_PATH, encoding="utf8") as f:
+            self.assertEqual(json.load(f), index)
+
+    def test_entry_appended_during_read_not_cached_as_missing(self):
+        first = llm_query.new_conversation("uuid-a")
+        read_index = llm_query._read_index
+
+        def read_then_append():
+            result = read_index()
+            # 模拟读取期间另一个进程追加了索引记录
+            llm_query._update_index("uuid-b", "/tmp/uuid-b.json")
+            return result
+
+        with patch.object(llm_query, "_read_index", side_effect=read_then_append):
+            self.assertEqual(llm_query._load_index(), {"uuid-a": first})
+        self.assertEqual(llm_query._load_index(), {"uuid-a": first, "uuid-b": "/tmp/uuid-b.json"})
+
+    def test_failed_history_save_removes_temp_file(self):
+        history_file = Path(self.test_dir.name) / "history.json"
+        with patch("llm_query.os.replace", side_effect=OSError("replace failed")), patch("builtins.print"):
+            llm_query.save_conversation_history(history_file, [{"role": "user", "content": "hi"}])
+        self.assertFalse(history_file.exists())
+        self.assertFalse(Path(f"{history_file}.tmp").exists())
+
+
+class TestThinkTags(unittest.TestCase):
+    """测试think标签的拆分"""
+
+    def test_handle_think_tags(self):
+        """测试完整标签、缺少开始标签和缺少结束标签三种情况"""
+        handle = llm_query._handle_think_tags
+        self.assertEqual(handle("<think>a\\nb</think>\n\nreply", ""), ("reply", "a\nb"))
+        self.assertEqual(handle("thought</think>\n\nreply", ""), ("reply", "thought"))
+        self.assertEqual(handle("<think>unfinished", "r"), ("<think>unfinished", "r"))
+        self.assertEqual(handle("", "r"), ("", "r"))
+
+
+class TestStreamPrinter(unittest.TestCase):
+    """测试流式输出的增量合并"""
+
+    @patch("llm_query._print_content")
+    def test_coalesces_deltas_and_flushes_on_style_change(self, mock_print):
+        printer = llm_query._StreamPrinter(None, interval=3600)
+        printer.write("a", style="#00ff00")
+        printer.write("b", style="#00ff00")
+        printer.write("c")
+        printer.write("d")
+        printer.flush()
+        self.assertEqual(
+            mock_print.call_args_list,
+            [call("a", None, style="#00ff00"), call("b", None, style="#00ff00"), call("cd", None, style=None)],
+        )
+
+    @patch("llm_query._print_content")
+    def test_zero_interval_prints_every_delta(self, mock_print):
+        printer = llm_query._StreamPrinter(None, interval=0)
+        for text in "abc":
+            printer.write(text)
+        printer.flush()
+        self.assertEqual([c.args[0] for c in mock_print.call_args_list], ["a", "b", "c"])
+
+    @patch("llm_query.threading.Timer")
+    @patch("llm_query._print_content")
+    def test_pending_text_flushed_during_pause(self, mock_print, mock_timer):
+        printer = llm_query._StreamPrinter(None, interval=3600)
+        printer.write("a")
+        printer.write("b")
+        self.assertEqual([c.args[0] for c in mock_print.call_args_list], ["a"])
+        # 直接调用定时器回调，模拟流停顿一个间隔后的输出
+        _, callback = mock_timer.call_args.args
+        self.assertEqual(callback, printer.flush)
+        callback()
+        self.assertEqual([c.args[0] for c in mock_print.call_args_list], ["a", "b"])
+        printer.flush()
+        self.assertEqual(mock_print.call_count, 2)
+
+    @patch("llm_query._stream_render_interval", return_value=3600)
+    @patch("llm_query._print_content")
+    def test_interrupted_stream_flushes_pending_text(self, mock_print, _interval):
+        def interrupted_stream():
+            for text in "ab":
+                yield MagicMock(choices=[MagicMock(delta=MagicMock(content=text, reasoning_content=None))])
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            llm_query._process_stream_response(interrupted_stream(), console=None)
+        self.assertEqual([c.args[0] for c in mock_print.call_args_list], ["a", "b"])
+
+
+class TestNewlineSearch(unittest.TestCase):
+    """测试换行符查找辅助函数"""
+
+    def test_find_nearest_newline(self):
+        content = "ab\ncd\nef"
+        self.assertEqual(llm_query.find_nearest_newline(0, content), 2)
+        self.assertEqual(llm_query.find_nearest_newline(6, content), 6)
+        self.assertEqual(llm_query.find_nearest_newline(4, content, "backward"), 2)
+        self.assertEqual(llm_query.find_nearest_newline(1, content, "backward"), 1)
+
+    def test_move_forward_from_position(self):
+        content = "ab\ncd\nef"
+        self.assertEqual(llm_query.move_forward_from_position(0, content), 3)
+        self.assertEqual(llm_query.move_forward_from_position(2, content), 3)
+        self.assertEqual(llm_query.move_forward_from_position(6, content), len(content))
+
+
+class TestProjectText(unittest.TestCase):
+    """测试项目分段文本解析"""
+
+    def test_parse_project_text(self):
+        fields = ["project_design", "readme", "dir_tree", "setup_script", "api_description"]
+        text = "".join(f"[{name.upper()}_START]\n{name} body\n[{name.upper()}_END]\n" for name in fields)
+        sections = llm_query.parse_project_text(text)
+        self.assertEqual(sections.readme, "readme body")
+        self.assertEqual(sections.api_description, "api_description body")
+
+    def test_parse_project_text_missing_fields(self):
+        with self.assertRaises(ValueError):
+            llm_query.parse_project_text("[README_START]x[README_END]")
+
+
+class TestObsidianIndexWriter(unittest.TestCase):
+    """测试Obsidian索引文件的追加写入"""
+
+    def test_append_reuses_handle_and_switches_file(self):
+        writer = llm_query._ObsidianIndexWriter()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            first = os.path.join(tmp_dir, "1-索引.md")
+            second = os.path.join(tmp_dir, "2-索引.md")
+            writer.append(first, "a\n")
+            handle = writer._file
+            writer.append(first, "b\n")
+            self.assertIs(writer._file, handle)
+            with open(first, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "a\nb\n")
+
+            writer.append(second, "c\n")
+            self.assertTrue(handle.closed)
+            writer.close()
+            with open(second, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "c\n")
+
+    def test_append_reopens_replaced_file(self):
+        writer = llm_query._ObsidianIndexWriter()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index = os.path.join(tmp_dir, "1-索引.md")
+            writer.append(index, "a\n")
+            # 模拟其他程序重写索引：写临时文件后rename替换
+            replacement = os.path.join(tmp_dir, "tmp.md")
+            with open(replacement, "w", encoding="utf-8") as f:
+                f.write("rewritten\n")
+            os.replace(replacement, index)
+            writer.append(index, "b\n")
+            with open(index, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "rewritten\nb\n")
+            os.remove(index)
+            writer.append(index, "c\n")
+            writer.close()
+            with open(index, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "c\n")
+
+
+class TestFetchSession(unittest.TestCase):
+    """测试HTTP会话按线程复用"""
+
+    def test_session_reused_per_thread(self):
+        session = llm_query._get_fetch_session()
+        self.assertIs(llm_query._get_fetch_session(), session)
+        self.assertFalse(session.trust_env)
+        with llm_query.ThreadPoolExecutor(max_workers=1) as executor:
+            other = executor.submit(llm_query._get_fetch_session).result()
+        self.assertIsNot(other, session)
+
 
 class TestFileHandling(unittest.TestCase):
     """测试文件处理功能"""
@@ -757,6 +992,38 @@ class TestDirectoryHandling(unittest.TestCase):
             result = _handle_local_file(match)
             self.assertNotIn("node_modules", result)
 
+    def test_directory_context_cached_until_mtime_changes(self):
+        """测试单层目录树在目录未变化时复用缓存"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch("llm_query._list_directory", return_value=("tree output", True)) as mock_list:
+                self.assertEqual(llm_query.get_directory_context(1, tmpdir), "tree output")
+                self.assertEqual(llm_query.get_directory_context(1, tmpdir), "tree output")
+                self.assertEqual(mock_list.call_count, 1)
+
+                stat = os.stat(tmpdir)
+                os.utime(tmpdir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+                llm_query.get_directory_context(1, tmpdir)
+                self.assertEqual(mock_list.call_count, 2)
+
+                gitignore = os.path.join(tmpdir, ".gitignore")
+                with open(gitignore, "w", encoding="utf8") as f:
+                    f.write("*.log\n")
+                llm_query.get_directory_context(1, tmpdir)
+                self.assertEqual(mock_list.call_count, 3)
+                # 只修改.gitignore内容不会改变目录mtime，但会影响tree --gitignore的结果
+                stat = os.stat(gitignore)
+                os.utime(gitignore, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+                llm_query.get_directory_context(1, tmpdir)
+                self.assertEqual(mock_list.call_count, 4)
+
+    def test_directory_context_fallback_not_cached(self):
+        """测试tree失败时的ls -l输出不进入缓存"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch("llm_query._list_directory", return_value=("ls output", False)) as mock_list:
+                llm_query.get_directory_context(1, tmpdir)
+                llm_query.get_directory_context(1, tmpdir)
+                self.assertEqual(mock_list.call_count, 2)
+
 
 class TestExtractAndDiffFiles(unittest.TestCase):
     def test_no_matches_returns_early(self):
@@ -803,6 +1070,37 @@ new content
                 llm_query.extract_and_diff_files(test_content, auto_apply=True)
                 self.assertEqual(test_file.read_text(), "new content")
 
+    def test_saved_file_messages_follow_input_order(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            names = [f"f{i}.txt" for i in range(6)]
+            matches = [("overwrite_whole_file", f"content {name}", str(Path(tmpdir) / name)) for name in names]
+            with (
+                patch("llm_query.shadowroot", Path(tmpdir) / "shadow"),
+                patch("llm_query._extract_file_matches", return_value=matches),
+                patch("llm_query._save_diff_content", return_value=None),
+                patch("builtins.print") as mock_print,
+            ):
+                llm_query.extract_and_diff_files("dummy", save=False)
+            saved = [c.args[0] for c in mock_print.call_args_list if c.args[0].startswith("已保存文件到")]
+            self.assertEqual([Path(msg.split(": ", 1)[1]).name for msg in saved], names)
+
+    def test_same_file_different_spelling_processed_serially(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            matches = [
+                ("overwrite_whole_file", "first", str(Path(tmpdir) / "a.txt")),
+                ("overwrite_whole_file", "second", os.path.join(tmpdir, "sub", "..", "a.txt")),
+            ]
+            with (
+                patch("llm_query._extract_file_matches", return_value=matches),
+                patch("llm_query._diff_matched_file", return_value=("shadow", "diff")) as mock_diff,
+                patch("llm_query._save_diff_content", return_value=None),
+                patch("llm_query.ThreadPoolExecutor") as mock_executor,
+                patch("builtins.print"),
+            ):
+                llm_query.extract_and_diff_files("dummy", save=False)
+            mock_executor.assert_not_called()
+            self.assertEqual([c.args[1] for c in mock_diff.call_args_list], ["first", "second"])
+
     def test_setup_script_processing(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             with patch("llm_query.shadowroot", Path(tmpdir)):
@@ -1399,12 +1697,37 @@ class TestChatbotUI(unittest.TestCase):
         with (
             patch("os.listdir") as mock_listdir,
             patch.dict("os.environ", {"GPT_PATH": "/test"}),
-            patch("os.path.exists", return_value=True),
+            patch("os.stat", return_value=MagicMock(st_mtime_ns=1)),
         ):
             mock_listdir.return_value = ["test1.md", "test2.txt"]
             prompts = self.chatbot._get_prompt_files()
             self.assertEqual(prompts, ["@test1.md", "@test2.txt"])
 
+    def test_prompt_files_cached_until_dir_changes(self):
+        with tempfile.TemporaryDirectory() as gpt_path, patch.dict("os.environ", {"GPT_PATH": gpt_path}):
+            prompts_dir = os.path.join(gpt_path, "prompts")
+            os.mkdir(prompts_dir)
+            Path(prompts_dir, "a.md").touch()
+            completer = self.chatbot.get_completer()
+            self.assertIn("@a.md", completer.words)
+
+            with patch("os.listdir") as mock_listdir:
+                self.assertIs(self.chatbot.get_completer(), completer)
+                mock_listdir.assert_not_called()
+
+            Path(prompts_dir, "b.md").touch()
+            stat = os.stat(prompts_dir)
+            os.utime(prompts_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            self.assertIs(self.chatbot.get_completer(), completer)
+            self.assertIn("@b.md", completer.words)
+
+    def test_missing_prompts_dir_reuses_completer_words(self):
+        with tempfile.TemporaryDirectory() as gpt_path, patch.dict("os.environ", {"GPT_PATH": gpt_path}):
+            words = self.chatbot.get_completer().words
+            with patch("os.listdir") as mock_listdir:
+                self.assertIs(self.chatbot.get_completer().words, words)
+                mock_listdir.assert_not_called()
+
     def test_keybindings_setup(self):
         from prompt_toolkit.keys import Keys
 
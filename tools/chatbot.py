@@ -25,42 +25,46 @@ from rich.text import Text
 from llm_query import GLOBAL_MODEL_CONFIG, GPTContextProcessor, query_gpt_api, ModelSwitch
 
 
-# 定义UI样式
+# 定义UI样式，运行期间不会改变，加载时只构建一次
+_EYE_CARE_STYLES = {
+    # 基础界面元素
+    "": "#4CAF50",  # 默认文本颜色
+    "prompt": "#4CAF50 bold",
+    "input": "#4CAF50",
+    "output": "#81C784",
+    "status": "#4CAF50",
+    # 自动补全菜单
+    "completion.current": "bg:#4CAF50 #ffffff",
+    "completion": "bg:#E8F5E9 #4CAF50",
+    "progress-button": "bg:#C8E6C9",
+    "progress-bar": "bg:#4CAF50",
+    # 滚动条
+    "scrollbar.button": "bg:#E8F5E9",
+    "scrollbar": "bg:#4CAF50",
+    # Markdown渲染
+    "markdown.heading": "#4CAF50 bold",
+    "markdown.code": "#4CAF50",
+    "markdown.list": "#4CAF50",
+    "markdown.blockquote": "#81C784",
+    "markdown.link": "#4CAF50 underline",
+    # GPT响应相关
+    "gpt.response": "#81C784",
+    "gpt.prefix": "#4CAF50 bold",
+    # 特殊符号
+    "special-symbol": "#4CAF50 italic",
+}
+_EYE_CARE_STYLE = Style.from_dict(_EYE_CARE_STYLES)
+_EYE_CARE_STYLE_HASH = hash(frozenset(_EYE_CARE_STYLES.items()))
+
+
 class EyeCareStyle:
     """护眼主题配色方案"""
 
-    def __init__(self):
-        self.styles = {
-            # 基础界面元素
-            "": "#4CAF50",  # 默认文本颜色
-            "prompt": "#4CAF50 bold",
-            "input": "#4CAF50",
-            "output": "#81C784",
-            "status": "#4CAF50",
-            # 自动补全菜单
-            "completion.current": "bg:#4CAF50 #ffffff",
-            "completion": "bg:#E8F5E9 #4CAF50",
-            "progress-button": "bg:#C8E6C9",
-            "progress-bar": "bg:#4CAF50",
-            # 滚动条
-            "scrollbar.button": "bg:#E8F5E9",
-            "scrollbar": "bg:#4CAF50",
-            # Markdown渲染
-            "markdown.heading": "#4CAF50 bold",
-            "markdown.code": "#4CAF50",
-            "markdown.list": "#4CAF50",
-            "markdown.blockquote": "#81C784",
-            "markdown.link": "#4CAF50 underline",
-            # GPT响应相关
-            "gpt.response": "#81C784",
-            "gpt.prefix": "#4CAF50 bold",
-            # 特殊符号
-            "special-symbol": "#4CAF50 italic",
-        }
+    styles = _EYE_CARE_STYLES
 
     def invalidation_hash(self):
         """生成样式哈希值用于缓存失效检测"""
-        return hash(frozenset(self.styles.items()))
+        return _EYE_CARE_STYLE_HASH
 
 
 class ChatbotUI:
@@ -109,6 +113,10 @@ class ChatbotUI:
         self.model = model
         self.model_switch = ModelSwitch()
         self.model_switch.select(model)
+        # 补全器和提示文件列表在prompts目录未变化时复用
+        self._completer = None
+        self._completer_prompt_files = None
+        self._prompt_cache = (None, [])
 
     def __str__(self) -> str:
         return (
@@ -119,7 +127,7 @@ class ChatbotUI:
 
     def _configure_style(self) -> Style:
         """配置终端样式为护眼风格"""
-        return Style.from_dict(EyeCareStyle().styles)
+        return _EYE_CARE_STYLE
 
     def _setup_keybindings(self) -> KeyBindings:
         """设置快捷键绑定"""
@@ -208,16 +216,26 @@ class ChatbotUI:
             self.console.print(f"[red]参数错误: {str(e)}[/]")
 
     def get_completer(self) -> WordCompleter:
-        """获取自动补全器，支持@和/两种补全模式"""
+        """获取自动补全器，支持@和/两种补全模式
+
+        补全器只创建一次，提示文件列表变化时才更新候选词
+        """
         prompt_files = self._get_prompt_files()
+        if self._completer is not None and prompt_files is self._completer_prompt_files:
+            return self._completer
+
         all_items = [s[0] for s in self._SYMBOL_DESCRIPTIONS] + prompt_files + [c[0] for c in self._COMMAND_LIST]
+        self._completer_prompt_files = prompt_files
+        if self._completer is not None:
+            self._completer.words = all_items
+            return self._completer
 
         meta_dict = {
             **{s[0]: s[1] for s in self._SYMBOL_DESCRIPTIONS},
             **{c[0]: c[1] for c in self._COMMAND_LIST},
         }
 
-        return WordCompleter(
+        self._completer = WordCompleter(
             words=all_items,
             meta_dict=meta_dict,
             ignore_case=True,
@@ -226,13 +244,21 @@ class ChatbotUI:
             match_middle=True,
             WORD=False,
         )
+        return self._completer
 
     def _get_prompt_files(self) -> list:
-        """获取提示文件列表"""
+        """获取提示文件列表，按(目录, 修改时间)缓存，目录内容变化后重新列出"""
         prompts_dir = os.path.join(os.getenv("GPT_PATH", ""), "prompts")
-        if os.path.exists(prompts_dir):
-            return ["@" + f for f in os.listdir(prompts_dir)]
-        return []
+        try:
+            cache_key = (prompts_dir, os.stat(prompts_dir).st_mtime_ns)
+        except OSError:
+            # 目录不存在时同样缓存空列表，返回同一对象，get_completer才能复用补全器
+            cache_key = (prompts_dir, None)
+        if self._prompt_cache[0] == cache_key:
+            return self._prompt_cache[1]
+        prompt_files = [] if cache_key[1] is None else ["@" + f for f in os.listdir(prompts_dir)]
+        self._prompt_cache = (cache_key, prompt_files)
+        return prompt_files
 
     def stream_response(self, prompt: str):
         """流式获取GPT响应并实时渲染Markdown